@@ -0,0 +1,360 @@
+"""Benchmark do consolidador com reports sintéticos e um SGS local
+
+Gera planilhas no formato de cada adaptador de EMPRESAS (mais empresas
+sintéticas, se pedido), serve séries falsas do SGS por HTTP local e mede as
+etapas de ReportProcessor (tratamento, extração, consolidação, deflação,
+gráficos, inflação) em vários tamanhos. O resultado é gravado em JSON para
+comparação entre versões:
+
+    python benchmark.py                                  # tamanhos padrão
+    python benchmark.py --tamanhos 40:60:0,120:400:15 -r 5
+    python benchmark.py --comparar benchmarks/bench_20250701_120000.json
+
+Tamanho = trimestres:linhas:empresas extras. Cada tamanho é medido nos modos
+de MODOS: leitura direta dos reports (padrão do consolidador), leitura dos
+arquivos tratados de data_treated, cache do BCB defasado (só a cauda é
+baixada) e BCB fora do ar (vale o cache). As mensagens do pipeline vão para
+benchmarks/bench_<data>.log. Com --comparar, etapas mais
+lentas que a referência acima da tolerância fazem o script sair com código 1.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import openpyxl
+
+import inflation
+from main_optimized import EMPRESAS, ROTULOS_PADRAO, Quarter, ReportProcessor, configurar_logging, registrar_empresa
+
+TAMANHOS_PADRAO = '40:60:0,80:200:5,120:400:15'
+# Etapas de ReportProcessor.medicoes agrupadas como no relatório do benchmark
+GRUPOS = {
+    'tratamento': ('tratamento',),
+    'extracao': ('extracao',),
+    'consolidacao': ('cubo', 'planilha', 'graficos_excel', 'gravacao', 'copia'),
+    'deflacao': ('deflacao',),
+    'graficos': ('grafico_png',),
+    'inflacao': ('inflacao', 'abas_inflacao'),
+}
+# Modos medidos em cada tamanho: tratamento em data_treated (save_treated) e estado do cache
+# do BCB ('frio': vazio; 'defasado': sem os últimos MESES_DEFASAGEM; 'offline': defasado, SGS fora do ar)
+MODOS = {
+    'direto': {'save_treated': False, 'bcb': 'frio'},
+    'tratado': {'save_treated': True, 'bcb': 'frio'},
+    'bcb_quente': {'save_treated': False, 'bcb': 'defasado'},
+    'bcb_offline': {'save_treated': False, 'bcb': 'offline'},
+}
+MESES_DEFASAGEM = 6
+# Rótulo de trimestre usado por empresa nos reports sintéticos (as empresas variam o formato)
+FORMATOS_TRIMESTRE = {
+    'Iguatemi': lambda q: f"{q.q}Q{q.year}",
+}
+
+
+def formato_trimestre(nome):
+    return FORMATOS_TRIMESTRE.get(nome, lambda q: f"{q.q}T{q.year % 100:02d}")
+
+
+def gerar_report(caminho, adaptador, trimestres, n_linhas, formato, seed=0):
+    """Grava um report sintético com a aba, células e rótulos do adaptador"""
+    rng = random.Random(seed)
+    celulas = {}
+    for metrica, cell_ref in adaptador['celulas'].items():
+        col = openpyxl.utils.column_index_from_string(''.join(filter(str.isalpha, cell_ref)))
+        row = int(''.join(filter(str.isdigit, cell_ref)))
+        celulas[row] = (col, metrica)
+    n_linhas = max(n_linhas, max(celulas))
+    label_col = min(col for col, _ in celulas.values())
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(adaptador['aba'])
+    for row in range(1, n_linhas + 1):
+        col, metrica = celulas.get(row, (label_col, None))
+        linha = [None] * (col - 1)
+        if metrica == 'Trimestres':
+            linha += [ROTULOS_PADRAO['Trimestres'][0]] + [formato(q) for q in trimestres]
+        else:
+            rotulo = (adaptador['rotulos'].get(metrica) or ROTULOS_PADRAO[metrica])[0] if metrica else f"Indicador {row}"
+            linha += [rotulo] + [round(rng.uniform(-0.1, 0.2), 4) for _ in trimestres]
+        ws.append(linha)
+    # Abas extras, como nos reports reais
+    wb.create_sheet('Outros').append(['Sem dados relevantes'])
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    wb.save(caminho)
+    return caminho
+
+
+def gerar_reports(pasta, n_trimestres, n_linhas, n_extras, fim=Quarter(2025, 1)):
+    """Gera um report por empresa de EMPRESAS, mais n_extras empresas sintéticas
+
+    As empresas sintéticas copiam o layout da Multiplan e são registradas em
+    EMPRESAS. Retorna {empresa: caminho do report}.
+    """
+    for i in range(1, n_extras + 1):
+        base = EMPRESAS['Multiplan']
+        registrar_empresa(f"Sintetica{i:02d}", base['aba'], base['celulas'], base['normalizar'])
+    trimestres = [Quarter.from_index(fim.index - n_trimestres + 1 + i) for i in range(n_trimestres)]
+    reports = {}
+    for seed, (nome, adaptador) in enumerate(EMPRESAS.items()):
+        caminho = Path(pasta) / adaptador['arquivo']
+        reports[nome] = str(gerar_report(caminho, adaptador, trimestres, n_linhas, formato_trimestre(nome), seed))
+    return reports
+
+
+def remover_sinteticas():
+    for nome in [nome for nome in EMPRESAS if nome.startswith('Sintetica')]:
+        del EMPRESAS[nome]
+
+
+def serie_sgs(codigo, inicio=(2000, 1), fim=(2025, 6)):
+    """Série mensal falsa e determinística no formato do SGS"""
+    dados = []
+    ano, mes = inicio
+    while (ano, mes) <= fim:
+        dados.append({'data': f"01/{mes:02d}/{ano}", 'valor': f"{((codigo * 7 + ano * 13 + mes * 3) % 120) / 100:.2f}"})
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return dados
+
+
+class SGSHandler(BaseHTTPRequestHandler):
+    """Responde /bcdata.sgs.<código>/dados como a API do SGS (inclusive o 404 de intervalo vazio)"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = re.search(r'bcdata\.sgs\.(\d+)/dados', url.path)
+        if not match:
+            self.send_error(404)
+            return
+        dados = serie_sgs(int(match.group(1)))
+        query = parse_qs(url.query)
+        if 'dataInicial' in query:
+            inicio = datetime.datetime.strptime(query['dataInicial'][0], '%d/%m/%Y')
+            fim = datetime.datetime.strptime(query['dataFinal'][0], '%d/%m/%Y')
+            dados = [d for d in dados if inicio <= datetime.datetime.strptime(d['data'], '%d/%m/%Y') <= fim]
+            if not dados:
+                self.send_error(404)
+                return
+        corpo = json.dumps(dados).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def preparar_cache_bcb(pasta):
+    """Cache do BCB (um JSON por série de inflation.codigos) sem os últimos MESES_DEFASAGEM meses"""
+    pasta = Path(pasta)
+    inflation.BCB_CACHE_DIR = pasta
+    for codigo in inflation.codigos.values():
+        inflation.save_cached_series(codigo, serie_sgs(codigo)[:-MESES_DEFASAGEM])
+    return pasta
+
+
+def url_fora_do_ar():
+    """Endereço local sem servidor (porta livre), para simular o SGS fora do ar"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+class ServidorSGS:
+    """Servidor SGS local numa thread; use como context manager (url = endereço base)"""
+
+    def __init__(self, porta=0):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', porta), SGSHandler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def executar(reports, pasta, modo='direto', parallel=False, sgs_url=None, cache_defasado=None, log=None):
+    """Uma execução completa do pipeline no modo `modo` (ver MODOS); retorna {grupo: segundos} e o total
+
+    cache_defasado é a pasta de preparar_cache_bcb, copiada a cada execução
+    nos modos que partem do cache do BCB; log é o arquivo de log (para a mensagem de erro).
+    """
+    config = MODOS[modo]
+    processor = ReportProcessor()
+    # Tudo que o pipeline grava fica na pasta temporária, não na pasta do projeto
+    os.chdir(pasta)
+    processor.reports.update(reports)
+    processor.destino = Path(pasta) / 'saida'
+    processor.pasta_graficos = Path(pasta) / 'saida'
+    processor.cache_extracao = None
+    processor.opcoes_grafico.update(abrir=False, cache=False)
+    # Cache do BCB novo a cada execução: vazio (download completo) ou cópia do cache defasado
+    cache_bcb = Path(tempfile.mkdtemp(dir=pasta, prefix='bcb_'))
+    if config['bcb'] != 'frio':
+        shutil.copytree(cache_defasado, cache_bcb, dirs_exist_ok=True)
+    inflation.BCB_CACHE_DIR = cache_bcb
+    inflation.SGS_BASE_URL = url_fora_do_ar() if config['bcb'] == 'offline' else sgs_url
+    inicio = time.perf_counter()
+    sucesso = processor.process_files(save_treated=config['save_treated'], parallel=parallel)
+    if not sucesso:
+        raise RuntimeError(f"Falha no processamento ({modo}); veja {log or 'o log'}")
+    total = time.perf_counter() - inicio
+    if processor.inflacao_mensal is None:
+        raise RuntimeError(f"Inflação não obtida no modo {modo}; veja {log or 'o log'}")
+    if config['bcb'] == 'defasado':
+        # A cauda que faltava foi baixada e gravada no cache
+        for codigo in inflation.codigos.values():
+            if inflation.load_cached_series(codigo)[-1] != serie_sgs(codigo)[-1]:
+                raise RuntimeError(f"Cache do BCB não atualizado com os meses novos da série {codigo}")
+    grupos = {grupo: sum(processor.medicoes.get(etapa, {}).get('wall_s', 0.0) for etapa in etapas)
+              for grupo, etapas in GRUPOS.items()}
+    # Agregação trimestral isolada (sem rede), para acompanhar só o cálculo
+    inicio = time.perf_counter()
+    inflation.compound_quarterly(processor.inflacao_mensal, list(inflation.codigos))
+    grupos['inflacao_agregacao'] = time.perf_counter() - inicio
+    return grupos, total
+
+
+def medir_tamanho(n_trimestres, n_linhas, n_extras, repeticoes, parallel, sgs_url, modos=tuple(MODOS), log=None):
+    """Mede um tamanho em cada modo; retorna um resultado por modo"""
+    pasta = tempfile.mkdtemp(prefix='bench_consolidador_')
+    cwd = os.getcwd()
+    try:
+        reports = gerar_reports(Path(pasta) / 'reports', n_trimestres, n_linhas, n_extras)
+        cache_defasado = preparar_cache_bcb(Path(pasta) / 'bcb_defasado')
+        resultados = []
+        for modo in modos:
+            amostras = []
+            totais = []
+            for _ in range(repeticoes):
+                grupos, total = executar(reports, pasta, modo, parallel, sgs_url, cache_defasado, log)
+                amostras.append(grupos)
+                totais.append(total)
+            etapas = {grupo: {'mediana_s': statistics.median(a[grupo] for a in amostras),
+                              'min_s': min(a[grupo] for a in amostras)}
+                      for grupo in amostras[0]}
+            etapas['total'] = {'mediana_s': statistics.median(totais), 'min_s': min(totais)}
+            resultados.append({'modo': modo, 'trimestres': n_trimestres, 'linhas': n_linhas,
+                               'empresas': len(EMPRESAS), 'etapas': etapas})
+        return resultados
+    finally:
+        os.chdir(cwd)
+        remover_sinteticas()
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+def versao_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, referencia, tolerancia):
+    """Imprime a razão atual/referência por etapa; retorna as regressões acima da tolerância"""
+    regressoes = []
+    # Resultados sem modo são de versões que só mediam a leitura dos arquivos tratados
+    chave = lambda r: (r['trimestres'], r['linhas'], r['empresas'], r.get('modo', 'tratado'))
+    por_tamanho = {chave(r): r for r in referencia['resultados']}
+    for resultado in atual['resultados']:
+        ref = por_tamanho.get(chave(resultado))
+        if ref is None:
+            continue
+        print(f"\n{resultado['trimestres']} trimestres, {resultado['linhas']} linhas, {resultado['empresas']} "
+              f"empresas, modo {resultado.get('modo', 'tratado')} (vs. {referencia.get('versao')}):")
+        for etapa, medida in resultado['etapas'].items():
+            base = ref['etapas'].get(etapa, {}).get('mediana_s')
+            if not base:
+                continue
+            razao = medida['mediana_s'] / base
+            # Variações abaixo de 10 ms são ruído de medição mesmo em etapas curtas
+            regrediu = razao > 1 + tolerancia and medida['mediana_s'] - base > 0.01
+            marca = '  <-- regressão' if regrediu else ''
+            print(f"  {etapa:<20} {base:8.3f}s -> {medida['mediana_s']:8.3f}s  ({razao:5.2f}x){marca}")
+            if marca:
+                regressoes.append((chave(resultado), etapa, razao))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do consolidador com dados sintéticos.')
+    parser.add_argument('--tamanhos', default=TAMANHOS_PADRAO,
+                        help=f'Lista trimestres:linhas:empresas_extras (padrão: {TAMANHOS_PADRAO})')
+    parser.add_argument('-r', '--repeticoes', type=int, default=3, help='Execuções por tamanho (vale a mediana)')
+    parser.add_argument('--parallel', action='store_true', help='Trata/lê as empresas em processos separados')
+    parser.add_argument('--modos', default=','.join(MODOS), help=f"Modos medidos (padrão: {','.join(MODOS)})")
+    parser.add_argument('--saida', default='benchmarks', help='Pasta onde o resultado JSON é gravado')
+    parser.add_argument('--comparar', metavar='JSON', help='Resultado anterior para comparação')
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help='Aumento relativo aceito antes de acusar regressão (padrão: 0.2 = 20%%)')
+    args = parser.parse_args(argv)
+    tamanhos = [tuple(int(x) for x in t.split(':')) for t in args.tamanhos.split(',')]
+    modos = [modo.strip() for modo in args.modos.split(',')]
+    desconhecidos = [modo for modo in modos if modo not in MODOS]
+    if desconhecidos:
+        parser.error(f"Modos desconhecidos: {', '.join(desconhecidos)} (válidos: {', '.join(MODOS)})")
+    saida = Path(args.saida).resolve()
+    referencia_path = Path(args.comparar).resolve() if args.comparar else None
+    saida.mkdir(parents=True, exist_ok=True)
+    nome = f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}"
+    # Mensagens do pipeline só no arquivo, sem custo de console durante as medições
+    log = saida / f"{nome}.log"
+    configurar_logging(arquivo=str(log), console=False)
+
+    resultado = {
+        'data': datetime.datetime.now().isoformat(timespec='seconds'),
+        'versao': versao_codigo(),
+        'parametros': {'repeticoes': args.repeticoes, 'parallel': args.parallel, 'modos': modos},
+        'ambiente': {'python': sys.version.split()[0], 'plataforma': sys.platform, 'cpus': os.cpu_count(),
+                     'openpyxl': openpyxl.__version__},
+        'resultados': [],
+    }
+    with ServidorSGS() as sgs:
+        for n_trimestres, n_linhas, n_extras in tamanhos:
+            print(f"Medindo {n_trimestres} trimestres, {n_linhas} linhas, {len(EMPRESAS) + n_extras} empresas...",
+                  flush=True)
+            medidas = medir_tamanho(n_trimestres, n_linhas, n_extras, args.repeticoes, args.parallel, sgs.url,
+                                    modos, log)
+            resultado['resultados'].extend(medidas)
+            for medida in medidas:
+                print(f"  modo {medida['modo']}:")
+                for etapa, valores in medida['etapas'].items():
+                    print(f"    {etapa:<20} {valores['mediana_s']:8.3f}s (mín. {valores['min_s']:.3f}s)")
+
+    arquivo = saida / f"{nome}.json"
+    with open(arquivo, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultado salvo em: {arquivo}")
+
+    if referencia_path:
+        with open(referencia_path, encoding='utf-8') as f:
+            referencia = json.load(f)
+        regressoes = comparar(resultado, referencia, args.tolerancia)
+        if regressoes:
+            print(f"\n{len(regressoes)} etapa(s) mais lenta(s) que a referência além de {args.tolerancia:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,44 +2,232 @@ import requests
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import openpyxl
-import matplotlib.pyplot as plt
-from openpyxl.drawing.image import Image
+import json
+import logging
+import os
+import sys
+import tempfile
 from pathlib import Path
-import shutil
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
 
 # --- PARTE 1: EXTRAÇÃO DOS DADOS DO BCB ---
-def get_bcb_data(series_code):
-    """Obtém dados do BCB via API do SGS e retorna um DataFrame"""
-    url = f"https://api.bcb.gov.br/dados/serie/bcdata.sgs.{series_code}/dados?formato=json"
+# URL base da API do SGS; pode ser trocada (ex.: servidor local de testes) via variável de ambiente
+SGS_BASE_URL = os.environ.get('SGS_BASE_URL', 'https://api.bcb.gov.br/dados/serie')
+# Timeout (conexão, leitura) em segundos de cada requisição ao SGS
+SGS_TIMEOUT = (5, 30)
+# Tentativas extras, com espera exponencial, em falhas de conexão ou erros 429/5xx
+SGS_RETRIES = 3
+SGS_BACKOFF = 0.5
+# Cache local das séries já baixadas (um JSON por série, no formato do SGS)
+BCB_CACHE_DIR = Path(os.environ.get('BCB_CACHE_DIR', Path(__file__).resolve().parent / 'bcb_cache'))
+
+def _cache_path(series_code):
+    return BCB_CACHE_DIR / f"sgs_{series_code}.json"
+
+def load_cached_series(series_code):
+    """Lê do cache os pontos já baixados da série (lista de {'data', 'valor'})"""
+    path = _cache_path(series_code)
+    if not path.exists():
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Cache da série %s ilegível, ignorando: %s", series_code, e)
+        return []
+
+def save_cached_series(series_code, dados):
+    """Grava a série no cache via um temporário exclusivo, trocado atomicamente (execuções simultâneas)"""
+    BCB_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _cache_path(series_code)
+    f = tempfile.NamedTemporaryFile('w', dir=BCB_CACHE_DIR, prefix=f"{path.stem}_", suffix='.tmp',
+                                    delete=False, encoding='utf-8')
+    try:
+        with f:
+            json.dump(dados, f, ensure_ascii=False)
+        os.replace(f.name, path)
+    except BaseException:
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass
+        raise
+
+def merge_series(cached, novos):
+    """Une os pontos do cache com os novos; em datas repetidas vale o dado novo"""
+    por_data = {item['data']: item for item in cached}
+    por_data.update({item['data']: item for item in novos})
+    return sorted(por_data.values(), key=lambda item: datetime.strptime(item['data'], '%d/%m/%Y'))
+
+def create_sgs_session(pool_size=10):
+    """Sessão HTTP com pool de conexões e retry com backoff, compartilhada entre as séries"""
+    retry = Retry(
+        total=SGS_RETRIES,
+        backoff_factor=SGS_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET'],
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def fetch_sgs(series_code, data_inicial=None, data_final=None, session=None, timeout=SGS_TIMEOUT):
+    """Consulta o SGS, opcionalmente restrito a um intervalo de datas (DD/MM/AAAA)"""
+    url = f"{SGS_BASE_URL}/bcdata.sgs.{series_code}/dados"
+    params = {'formato': 'json'}
+    if data_inicial:
+        params['dataInicial'] = data_inicial
+        params['dataFinal'] = data_final or datetime.now().strftime('%d/%m/%Y')
+    response = (session or requests).get(url, params=params, timeout=timeout)
+    # O SGS responde 404 quando não há pontos no intervalo pedido
+    if data_inicial and response.status_code == 404:
+        return []
+    response.raise_for_status()
+    return response.json()
+
+def get_bcb_data(series_code, session=None):
+    """Obtém dados do BCB via API do SGS e retorna um DataFrame
+
+    Usa o cache local: só o trecho final da série (a partir do último ponto
+    salvo, que é rebaixado para pegar revisões) é pedido ao SGS. Se a API
+    estiver fora do ar, retorna o que houver no cache.
+    """
+    cached = load_cached_series(series_code)
+    dados = cached
+    try:
+        if cached:
+            ultima_data = cached[-1]['data']
+            novos = fetch_sgs(series_code, data_inicial=ultima_data, session=session)
+        else:
+            novos = fetch_sgs(series_code, session=session)
+        dados = merge_series(cached, novos)
+        if dados != cached:
+            save_cached_series(series_code, dados)
+    except Exception as e:
+        if not cached:
+            logger.error("Erro ao obter série %s: %s", series_code, e)
+            return None
+        logger.warning("API do BCB indisponível para a série %s, usando cache local: %s", series_code, e)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        dados = response.json()
         df = pd.DataFrame(dados)
         df['data'] = pd.to_datetime(df['data'], dayfirst=True)
         df['valor'] = pd.to_numeric(df['valor'].str.replace(',', '.'))
         return df
     except Exception as e:
-        print(f"Erro ao obter série {series_code}: {e}")
+        logger.error("Erro ao obter série %s: %s", series_code, e)
         return None
 
+def get_bcb_series(codigos, max_workers=None):
+    """Baixa em paralelo todas as séries de `codigos` (nome -> código SGS)
+
+    As requisições compartilham uma única sessão com pool de conexões. Retorna
+    um dicionário nome -> DataFrame (colunas 'data' e nome) só com as séries
+    obtidas com sucesso.
+    """
+    if not codigos:
+        return {}
+    max_workers = max_workers or len(codigos)
+    session = create_sgs_session(pool_size=max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {nome: executor.submit(get_bcb_data, codigo, session) for nome, codigo in codigos.items()}
+            dfs = {}
+            for nome, futuro in futuros.items():
+                df = futuro.result()
+                if df is not None:
+                    dfs[nome] = df[['data', 'valor']].rename(columns={'valor': nome})
+            return dfs
+    finally:
+        session.close()
+
+# Séries mensais do SGS já mapeadas; para levá-las ao consolidado, basta incluí-las em `codigos`
+SERIES_SGS = {
+    'IPCA': 433,     # IPCA - Variação mensal (%)
+    'IGPM': 189,     # IGP-M - Variação mensal (%)
+    'IPCA15': 7478,  # IPCA-15 - Variação mensal (%)
+    'IGPDI': 190,    # IGP-DI - Variação mensal (%)
+    'INCC': 192,     # INCC - Variação mensal (%)
+    'CDI': 4391,     # CDI acumulado no mês (%)
+    'Selic': 4390,   # Selic acumulada no mês (%)
+}
+
 # Códigos das séries no BCB (SGS)
 codigos = {
-    'IPCA': 433,  # IPCA - Variação mensal (%)
-    'IGPM': 189,  # IGP-M - Variação mensal (%)
+    'IPCA': SERIES_SGS['IPCA'],
+    'IGPM': SERIES_SGS['IGPM'],
 }
 
-dfs = {}
-for nome, codigo in codigos.items():
-    df = get_bcb_data(codigo)
-    if df is not None:
-        dfs[nome] = df[['data', 'valor']].rename(columns={'valor': nome})
+def build_monthly(dfs, codigos):
+    """Une as séries (nome -> DataFrame 'data'/nome) num único DataFrame mensal"""
+    mensal = None
+    for nome in codigos:
+        mensal = dfs[nome] if mensal is None else pd.merge(mensal, dfs[nome], on='data', how='outer')
+    return mensal.sort_values('data').reset_index(drop=True)
+
+# --- PARTE 2: CÁLCULO DOS TRIMESTRES ---
+def compound_quarterly(df_mensal, colunas):
+    """Acumula por trimestre as variações mensais (%) de cada série em `colunas`
+
+    Agrupa por um PeriodIndex trimestral e compõe todas as colunas de uma vez
+    (produto de 1 + x/100, ignorando meses sem dado). Retorna um DataFrame
+    numérico indexado pelo trimestre, já em ordem cronológica; trimestres sem
+    nenhum dado de uma série ficam como NaN.
+    """
+    trimestres = pd.PeriodIndex(df_mensal['data'], freq='Q')
+    fatores = 1 + df_mensal[colunas].apply(pd.to_numeric, errors='coerce') / 100
+    acumulado = fatores.groupby(trimestres).prod(min_count=1)
+    acumulado = (acumulado - 1) * 100
+    acumulado.index.name = 'trimestre'
+    return acumulado.sort_index()
+
+def format_trimestre_labels(periodos):
+    """Rótulos no formato usado no consolidado (ex.: 1Q25) para um PeriodIndex trimestral"""
+    anos = pd.Series(periodos.year % 100).astype(str).str.zfill(2)
+    return (pd.Series(periodos.quarter).astype(str) + 'Q' + anos).tolist()
+
+def format_quarterly(trimestral_num):
+    """Tabela trimestral como texto: coluna 'trimestre' (1Q25) e valores com vírgula ('' se faltar)"""
+    trimestral = trimestral_num.apply(lambda col: col.map(lambda v: f"{v:.2f}".replace('.', ','), na_action='ignore'))
+    trimestral.insert(0, 'trimestre', format_trimestre_labels(trimestral_num.index))
+    trimestral = trimestral.reset_index(drop=True)
+    # Substituir NaN por string vazia
+    return trimestral.replace({np.nan: ''})
+
+def get_inflation_data(codigos=codigos):
+    """Baixa as séries de inflação e retorna (mensal, trimestral)
 
-# Unir os dados em um único DataFrame mensal
-if len(dfs) == 2:
-    df_final = pd.merge(dfs['IPCA'], dfs['IGPM'], on='data', how='outer')
-    df_final = df_final.sort_values('data').reset_index(drop=True)
+    mensal tem a coluna 'data' (datetime) e uma coluna numérica (%) por série;
+    trimestral é numérico, indexado por trimestre (PeriodIndex) em ordem
+    cronológica. Levanta RuntimeError se alguma série não puder ser obtida.
+    """
+    dfs = get_bcb_series(codigos)
+    faltando = [nome for nome in codigos if nome not in dfs]
+    if faltando:
+        raise RuntimeError(f"Falha ao obter dados das séries: {', '.join(faltando)}")
+    mensal = build_monthly(dfs, codigos)
+    # Mesma precisão publicada pelo BCB (e gravada no CSV mensal)
+    mensal[list(codigos)] = mensal[list(codigos)].round(2)
+    trimestral = compound_quarterly(mensal, list(codigos))
+    return mensal, trimestral
+
+def main(verbose=False):
+    """Atualiza os CSVs de inflação mensal e trimestral no diretório atual
+
+    Com verbose=True também exibe as tabelas mensal e trimestral completas.
+    """
+    try:
+        mensal, trimestral_num = get_inflation_data()
+    except RuntimeError as e:
+        print(f"❌ Falha ao obter dados de uma das séries: {e}")
+        return 1
+
+    df_final = mensal.copy()
     # Formatar data para DD/MM/YYYY
     df_final['data'] = df_final['data'].dt.strftime('%d/%m/%Y')
     # Salvar em CSV mensal
@@ -55,105 +243,24 @@ if len(dfs) == 2:
     )
     print(f"✅ Arquivo mensal salvo: {nome_arquivo}")
     print(f"📊 Total de registros: {len(df_final)}")
-else:
-    print("❌ Falha ao obter dados de uma das séries.")
-    exit(1)
 
-# --- PARTE 2: CÁLCULO DOS TRIMESTRES ---
-csv_in = nome_arquivo
-df = pd.read_csv(csv_in, encoding='utf-8')
-df['data'] = pd.to_datetime(df['data'], format='%d/%m/%Y', errors='coerce')
-df = df.dropna(subset=['data'])
-
-def get_trimestre(dt):
-    trimestre = (dt.month - 1) // 3 + 1
-    return f'{trimestre}Q{str(dt.year)[-2:]}'
-
-df['trimestre'] = df['data'].apply(get_trimestre)
-
-def acumulado_composto(serie):
-    serie = pd.to_numeric(serie, errors='coerce').dropna()
-    if len(serie) == 0:
-        return np.nan
-    fatores = (1 + serie/100)
-    return (fatores.prod() - 1) * 100
-
-trimestres_unicos = df['trimestre'].unique()
-trimestres_unicos.sort()
-
-resultados = []
-for trimestre in trimestres_unicos:
-    grupo = df[df['trimestre'] == trimestre]
-    ipca = acumulado_composto(grupo['IPCA'])
-    igpm = acumulado_composto(grupo['IGPM'])
-    # Formatar com vírgula como separador decimal
-    ipca_str = f"{ipca:.2f}".replace('.', ',') if not pd.isna(ipca) else ''
-    igpm_str = f"{igpm:.2f}".replace('.', ',') if not pd.isna(igpm) else ''
-    resultados.append({'trimestre': trimestre, 'IPCA': ipca_str, 'IGPM': igpm_str})
-
-trimestral = pd.DataFrame(resultados)
-trimestral['ano'] = trimestral['trimestre'].str.extract(r'(\d{2})$').astype(int)
-trimestral['tri'] = trimestral['trimestre'].str.extract(r'^(\d)Q').astype(int)
-trimestral = trimestral.sort_values(['ano', 'tri']).drop(['ano', 'tri'], axis=1).reset_index(drop=True)
-
-# Substituir NaN por string vazia antes de salvar
-trimestral = trimestral.replace({np.nan: ''})
-# Salvar em novo CSV
-csv_out = 'ipca_igpm_trimestres.csv'
-trimestral.to_csv(csv_out, index=False, encoding='utf-8', sep=',')
-
-print('\n--- DADOS MENSAIS ---')
-print(df_final)
-print('\n--- DADOS TRIMESTRAIS ---')
-print(trimestral)
-
-def add_charts_with_xlsxwriter(input_excel, output_excel):
-    # Lê a primeira aba do consolidado
-    df = pd.read_excel(input_excel, sheet_name=0)
-    
-    # Filtra apenas as linhas de SSS_Descontado e SSR_Descontado
-    sss = df[df['Métrica'] == 'SSS_Descontado']
-    ssr = df[df['Métrica'] == 'SSR_Descontado']
-    
-    # Cria um novo arquivo Excel com XlsxWriter
-    with pd.ExcelWriter(output_excel, engine='xlsxwriter') as writer:
-        df.to_excel(writer, sheet_name='Consolidado', index=False)
-        workbook  = writer.book
-        worksheet = writer.sheets['Consolidado']
-        
-        # Descobre o range dos dados
-        n_trimestres = len(df.columns) - 2
-        first_row = 1  # Cabeçalho está na linha 0
-        sss_rows = sss.index.tolist()
-        ssr_rows = ssr.index.tolist()
-        
-        # Adiciona gráfico de linhas para SSS_Descontado
-        chart1 = workbook.add_chart({'type': 'line'})
-        for row in sss_rows:
-            chart1.add_series({
-                'name':       ['Consolidado', row+1, 0],
-                'categories': ['Consolidado', 0, 2, 0, n_trimestres+1],
-                'values':     ['Consolidado', row+1, 2, row+1, n_trimestres+1],
-            })
-        chart1.set_title({'name': 'SSS_Descontado'})
-        chart1.set_x_axis({'name': 'Trimestre'})
-        chart1.set_y_axis({'name': '%'})
-        worksheet.insert_chart('A40', chart1)
-        
-        # Adiciona gráfico de linhas para SSR_Descontado
-        chart2 = workbook.add_chart({'type': 'line'})
-        for row in ssr_rows:
-            chart2.add_series({
-                'name':       ['Consolidado', row+1, 0],
-                'categories': ['Consolidado', 0, 2, 0, n_trimestres+1],
-                'values':     ['Consolidado', row+1, 2, row+1, n_trimestres+1],
-            })
-        chart2.set_title({'name': 'SSR_Descontado'})
-        chart2.set_x_axis({'name': 'Trimestre'})
-        chart2.set_y_axis({'name': '%'})
-        worksheet.insert_chart('J40', chart2)
-        
-    print(f"Arquivo com gráficos salvo em: {output_excel}")
-
-# Exemplo de uso:
-add_charts_with_xlsxwriter('data_treated/Consolidado.xlsx', 'data_treated/Consolidado_com_graficos.xlsx') 
\ No newline at end of file
+    trimestral = format_quarterly(trimestral_num)
+    # Salvar em novo CSV
+    csv_out = 'ipca_igpm_trimestres.csv'
+    trimestral.to_csv(csv_out, index=False, encoding='utf-8', sep=',')
+
+    print(f"✅ Arquivo trimestral salvo: {csv_out} ({len(trimestral)} trimestres)")
+
+    if verbose:
+        print('\n--- DADOS MENSAIS ---')
+        print(df_final.to_string())
+        print('\n--- DADOS TRIMESTRAIS ---')
+        print(trimestral.to_string())
+    return 0
+
+if __name__ == "__main__":
+    verbose = '-v' in sys.argv[1:] or '--verbose' in sys.argv[1:]
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format="%(levelname)s %(message)s")
+    codigo_saida = main(verbose=verbose)
+    if codigo_saida:
+        sys.exit(codigo_saida) 
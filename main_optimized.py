@@ -1,34 +1,645 @@
 import sys
 import os
 import shutil
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
 import threading
 from pathlib import Path
 import time
+import datetime
+import argparse
+import contextlib
+import cProfile
+import pstats
+import tracemalloc
+import functools
+import hashlib
+import json
 import openpyxl
-import csv
+from openpyxl.chart import LineChart, Reference, Series
+from openpyxl.chart.data_source import AxDataSource, StrRef
 import re
+import unicodedata
 import traceback
 import logging
-import glob
+import logging.handlers
+import queue
+import atexit
 import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-import matplotlib.pyplot as plt
+import inflation
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Garante que não tenta abrir janela de plot
 
-logging.basicConfig(
-    filename="erro_consolidador.log",
-    level=logging.DEBUG,
-    format="%(asctime)s %(levelname)s %(message)s"
-)
+# Log do consolidador; configurar_logging liga o arquivo e o console
+logger = logging.getLogger('consolidador')
+_log_listener = None
+
+def configurar_logging(verbose=False, arquivo="erro_consolidador.log", console=True):
+    """Configura o log em níveis, gravado fora da thread que registra a mensagem
+
+    As mensagens vão para uma fila (QueueHandler) e um QueueListener grava o
+    arquivo e o console em segundo plano. Por padrão só INFO ou acima é
+    registrado; com verbose=True entram as mensagens DEBUG (uma por linha
+    extraída, trimestre, gráfico...), no arquivo e no console. Com
+    console=False as mensagens vão só para o arquivo.
+    """
+    global _log_listener
+    _encerrar_logging()
+    nivel = logging.DEBUG if verbose else logging.INFO
+    handlers = []
+    handler_arquivo = logging.FileHandler(arquivo, encoding='utf-8')
+    handler_arquivo.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    handlers.append(handler_arquivo)
+    # No executável sem console não há stdout
+    if console and sys.stdout is not None:
+        handler_console = logging.StreamHandler(sys.stdout)
+        handler_console.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt='%H:%M:%S'))
+        handlers.append(handler_console)
+    fila = queue.SimpleQueue()
+    raiz = logging.getLogger()
+    for handler in raiz.handlers[:]:
+        raiz.removeHandler(handler)
+    raiz.addHandler(logging.handlers.QueueHandler(fila))
+    raiz.setLevel(nivel)
+    _log_listener = logging.handlers.QueueListener(fila, *handlers)
+    _log_listener.start()
+    return _log_listener
+
+@atexit.register
+def _encerrar_logging():
+    """Grava as mensagens pendentes e fecha os arquivos do listener atual (também na saída do programa)"""
+    global _log_listener
+    if _log_listener is None:
+        return
+    _log_listener.stop()
+    for handler in _log_listener.handlers:
+        handler.close()
+    _log_listener = None
+
+def _configurar_logging_worker():
+    """Log dos processos do pool: avisos e erros no stderr, sem a fila do processo principal"""
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s", force=True)
+
+# Formatos numéricos do Excel (a exibição com vírgula segue o idioma do Excel)
+FORMATO_PERCENTUAL = '0.00%'
+FORMATO_INFLACAO = '0.00'
+CORES_GRAFICO = ['#1f77b4', '#ff7f0e', '#2ca02c']
+# Gráficos nativos do Excel (aba Graficos): um por métrica, seguido da versão
+# descontada pela inflação quando ela existir no consolidado
+GRAFICOS_EXCEL = ('SSS', 'SSR', 'OC', 'TXOcup', 'InadimplenciaLiq')
+# Peso de cada etapa (ver ReportProcessor.medir) na barra de progresso, proporcional ao tempo típico
+PESO_ETAPAS = {'inflacao': 10, 'tratamento': 20, 'extracao': 25, 'cubo': 2, 'planilha': 4, 'abas_inflacao': 3,
+               'deflacao': 2, 'graficos_excel': 4, 'gravacao': 8, 'grafico_png': 20, 'copia': 2}
+# Linhas lidas entre duas verificações de progresso/cancelamento
+BLOCO_LINHAS = 200
+# Nome dos reports publicados: "<Empresa> Planilha <trimestre>.xlsx" (ex.: Allos Planilha 1T25.xlsx)
+PADRAO_REPORT = re.compile(r"^(?P<empresa>.+?)\s+Planilha\s+(?P<trimestre>\S+)\.xlsx$", re.IGNORECASE)
+# Rótulos (coluna da célula de get_row_refs) que identificam cada linha nos reports,
+# em português e inglês; ReportProcessor.rotulos permite variantes por empresa
+ROTULOS_PADRAO = {
+    'Trimestres': ('Trimestre', 'Quarter', 'Período', 'Period'),
+    'SSS': ('SSS', 'Vendas Mesmas Lojas', 'Vendas Mesmas Lojas (SSS)', 'Same Store Sales', 'Same Store Sales (SSS)'),
+    'SSR': ('SSR', 'Aluguéis Mesmas Lojas', 'Aluguel Mesmas Lojas', 'Aluguel Mesmas Lojas (SSR)',
+            'Same Store Rent', 'Same Store Rent (SSR)'),
+    'OC': ('Custo de Ocupação', 'Custo de Ocupação (% das vendas)', 'Occupancy Cost', 'Occupancy Cost (% of sales)'),
+    'TXOcup': ('Taxa de Ocupação', 'Taxa de Ocupação Média', 'Occupancy Rate', 'Average Occupancy Rate'),
+    'InadimplenciaLiq': ('Inadimplência Líquida', 'Inadimplência Líquida (%)', 'Net Delinquency',
+                         'Net Delinquency Rate', 'Net Default'),
+}
+# Adaptadores por empresa: report padrão, arquivo tratado (debug), aba, normalização
+# dos decimais, célula de cada linha (rótulo na coluna da célula, valores à direita;
+# usada quando o rótulo não é encontrado) e rótulos próprios além de ROTULOS_PADRAO.
+# Novas empresas entram por registrar_empresa ou carregar_empresas, sem código novo.
+EMPRESAS = {
+    'Allos': {
+        'arquivo': 'Allos Planilha 1T25.xlsx', 'tratado': 'allos_data.xlsx',
+        'aba': 'Indicadores', 'normalizar': False,
+        'celulas': {'Trimestres': 'B17', 'SSS': 'B22', 'SSR': 'B14', 'OC': 'B23', 'TXOcup': 'B25',
+                    'InadimplenciaLiq': 'B24'},
+        'rotulos': {},
+    },
+    'Iguatemi': {
+        'arquivo': 'Iguatemi Planilha 1T25.xlsx', 'tratado': 'iguatemi_data.xlsx',
+        'aba': 'Indicadores | Indicators', 'normalizar': True,
+        'celulas': {'Trimestres': 'B48', 'SSS': 'B54', 'SSR': 'B17', 'OC': 'B19', 'TXOcup': 'B20',
+                    'InadimplenciaLiq': 'B21'},
+        'rotulos': {},
+    },
+    'Multiplan': {
+        'arquivo': 'Multiplan Planilha 1T25.xlsx', 'tratado': 'Multiplan_data.xlsx',
+        'aba': 'Indicadores | Indicators', 'normalizar': True,
+        'celulas': {'Trimestres': 'B6', 'SSS': 'B37', 'SSR': 'B38', 'OC': 'B39', 'TXOcup': 'B43',
+                    'InadimplenciaLiq': 'B45'},
+        'rotulos': {},
+    },
+}
+
+def registrar_empresa(nome, aba, celulas, normalizar=True, rotulos=None, arquivo=None, tratado=None):
+    """Adiciona (ou substitui) o adaptador de uma empresa em EMPRESAS
+
+    celulas precisa ter 'Trimestres' (cabeçalho) e as métricas desejadas.
+    """
+    if 'Trimestres' not in celulas:
+        raise ValueError(f"Adaptador de {nome} sem a célula de 'Trimestres'")
+    slug = re.sub(r'\W+', '_', nome).lower()
+    EMPRESAS[nome] = {
+        'arquivo': arquivo or f"{nome} Planilha 1T25.xlsx",
+        'tratado': tratado or f"{slug}_data.xlsx",
+        'aba': aba, 'normalizar': normalizar, 'celulas': dict(celulas),
+        'rotulos': {metrica: tuple(aliases) for metrica, aliases in (rotulos or {}).items()},
+    }
+
+def carregar_empresas(caminho):
+    """Registra os adaptadores de um JSON {nome: {aba, celulas, normalizar, rotulos, arquivo, tratado}}"""
+    with open(caminho, encoding='utf-8') as f:
+        adaptadores = json.load(f)
+    for nome, adaptador in adaptadores.items():
+        registrar_empresa(nome, **adaptador)
+    return list(adaptadores)
 
 def debug_print(message):
-    """Print com timestamp para debug"""
-    timestamp = time.strftime('%H:%M:%S')
-    print(f"[{timestamp}] {message}")
+    """Mensagem de acompanhamento (nível INFO; o console mostra o horário)"""
+    logger.info(message)
+
+@functools.total_ordering
+class Quarter:
+    """Trimestre compacto, representado pelo índice inteiro ano*4 + trimestre
+
+    Ordenação, filtros por período e alinhamento entre empresas viram
+    operações sobre inteiros; o rótulo (ex.: 1Q25) só é gerado na saída.
+    """
+    __slots__ = ('index',)
+
+    # Variantes publicadas pelas empresas: 1T25, 1Q2025, 1º 25, 1ºT25, 2025Q1, 2025-03-31...
+    # Notas ou sufixos depois do ano são aceitos (4T24*, 1T25 ¹, 2T25 (ajustado))
+    _TRIMESTRE_ANO = re.compile(r"^\s*([1-4])\s*(?:[TQ]|º\s*T?)\s*[-/]?\s*(\d{4}|\d{2})(?!\d).*$", re.IGNORECASE)
+    _ANO_TRIMESTRE = re.compile(r"^\s*(\d{4})\s*[-/]?\s*[TQ]\s*([1-4])(?!\d).*$", re.IGNORECASE)
+    _DATA_ISO = re.compile(r"^\s*(\d{4})-(\d{2})-\d{2}")
+
+    def __init__(self, year, q):
+        self.index = year * 4 + q
+
+    @classmethod
+    def from_index(cls, index):
+        quarter = cls.__new__(cls)
+        quarter.index = index
+        return quarter
+
+    @classmethod
+    def parse(cls, value):
+        """Converte um rótulo (ou data) de trimestre em Quarter; None se não reconhecer"""
+        if isinstance(value, Quarter):
+            return value
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return cls(value.year, (value.month - 1) // 3 + 1)
+        if not isinstance(value, str):
+            return None
+        match = cls._TRIMESTRE_ANO.match(value)
+        if match:
+            q, ano = int(match.group(1)), int(match.group(2))
+        else:
+            match = cls._ANO_TRIMESTRE.match(value)
+            if match:
+                ano, q = int(match.group(1)), int(match.group(2))
+            else:
+                match = cls._DATA_ISO.match(value)
+                if not match:
+                    return None
+                ano, q = int(match.group(1)), (int(match.group(2)) - 1) // 3 + 1
+        if ano < 100:
+            ano += 2000 if ano < 80 else 1900
+        return cls(ano, q)
+
+    @property
+    def year(self):
+        return (self.index - 1) // 4
+
+    @property
+    def q(self):
+        return (self.index - 1) % 4 + 1
+
+    def __eq__(self, other):
+        return isinstance(other, Quarter) and self.index == other.index
+
+    def __lt__(self, other):
+        if not isinstance(other, Quarter):
+            return NotImplemented
+        return self.index < other.index
+
+    def __hash__(self):
+        return hash(self.index)
+
+    def __str__(self):
+        return f"{self.q}Q{self.year % 100:02d}"
+
+    def __repr__(self):
+        return f"Quarter({self.year}, {self.q})"
+
+class MetricCube:
+    """Cubo denso empresa x métrica x trimestre (float64, NaN onde não há dado)
+
+    Cada eixo tem um índice de rótulos; o eixo de trimestres é contínuo entre
+    o primeiro e o último trimestre, de modo que a posição de um Quarter é
+    q.index - início. Fatias como "todo o SSS de 2020 a 2025" ou "Multiplan em
+    todas as métricas" são views do array, sem cópia.
+    """
+
+    def __init__(self, empresas, metricas, inicio, fim):
+        self.empresas = list(empresas)
+        self.metricas = list(metricas)
+        self._empresa_idx = {e: i for i, e in enumerate(self.empresas)}
+        self._metrica_idx = {m: i for i, m in enumerate(self.metricas)}
+        self.inicio = inicio.index if inicio is not None else 0
+        n_trimestres = fim.index - inicio.index + 1 if inicio is not None else 0
+        self.values = np.full((len(self.empresas), len(self.metricas), n_trimestres), np.nan)
+        # Pares (empresa, métrica) que existem no consolidado, mesmo sem nenhum valor
+        self.present = np.zeros((len(self.empresas), len(self.metricas)), dtype=bool)
+
+    @classmethod
+    def from_series(cls, series):
+        """Monta o cubo a partir de {(empresa, métrica): {Quarter: valor}}"""
+        empresas = list(dict.fromkeys(e for e, _ in series))
+        metricas = list(dict.fromkeys(m for _, m in series))
+        quarters = [q for valores in series.values() for q in valores]
+        cube = cls(empresas, metricas, min(quarters, default=None), max(quarters, default=None))
+        for (empresa, metrica), valores in series.items():
+            i, j = cube._empresa_idx[empresa], cube._metrica_idx[metrica]
+            cube.present[i, j] = True
+            if valores:
+                posicoes = np.fromiter((q.index - cube.inicio for q in valores), dtype=np.intp, count=len(valores))
+                cube.values[i, j, posicoes] = np.fromiter(valores.values(), dtype=float, count=len(valores))
+        return cube
+
+    @classmethod
+    def from_frame(cls, df):
+        """Monta o cubo a partir da tabela consolidada (Empresa, Métrica, trimestres...)"""
+        df = df.dropna(subset=['Métrica'])
+        quarters = [Quarter.parse(t) for t in df.columns[2:]]
+        series = {}
+        for empresa, metrica, *valores in df.itertuples(index=False, name=None):
+            series[(empresa, metrica)] = {q: pd.to_numeric(v, errors='coerce') for q, v in zip(quarters, valores)
+                                          if q is not None}
+        return cls.from_series(series)
+
+    @property
+    def quarters(self):
+        return [Quarter.from_index(self.inicio + k) for k in range(self.values.shape[2])]
+
+    def quarter_slice(self, inicio=None, fim=None):
+        """Fatia (O(1)) do eixo de trimestres entre inicio e fim, inclusive"""
+        n = self.values.shape[2]
+        start = 0 if inicio is None else min(max(inicio.index - self.inicio, 0), n)
+        stop = n if fim is None else min(max(fim.index - self.inicio + 1, 0), n)
+        return slice(start, max(start, stop))
+
+    def get(self, empresa=None, metrica=None, inicio=None, fim=None):
+        """Consulta o cubo; eixos não informados vêm inteiros (ex.: get(metrica='SSS'))"""
+        i = slice(None) if empresa is None else self._empresa_idx[empresa]
+        j = slice(None) if metrica is None else self._metrica_idx[metrica]
+        return self.values[i, j, self.quarter_slice(inicio, fim)]
+
+    def add_metric(self, metrica, valores, present=None):
+        """Acrescenta uma métrica (matriz empresa x trimestre) ao cubo"""
+        self._metrica_idx[metrica] = len(self.metricas)
+        self.metricas.append(metrica)
+        self.values = np.concatenate([self.values, np.asarray(valores, dtype=float)[:, None, :]], axis=1)
+        if present is None:
+            present = ~np.isnan(valores).all(axis=1)
+        self.present = np.concatenate([self.present, np.asarray(present, dtype=bool)[:, None]], axis=1)
+
+    def rows(self, metricas=None):
+        """(empresa, métrica, vetor) de cada par existente, empresa a empresa"""
+        metricas = self.metricas if metricas is None else metricas
+        for i, empresa in enumerate(self.empresas):
+            for metrica in metricas:
+                j = self._metrica_idx[metrica]
+                if self.present[i, j]:
+                    yield empresa, metrica, self.values[i, j]
+
+class WorkbookCache:
+    """Cache de workbooks/planilhas abertos durante uma única consolidação"""
+
+    def __init__(self, read_only=True, data_only=True):
+        self.read_only = read_only
+        self.data_only = data_only
+        self._workbooks = {}
+
+    def get_workbook(self, path):
+        """Retorna o workbook, abrindo o arquivo apenas na primeira vez"""
+        wb = self._workbooks.get(path)
+        if wb is None:
+            wb = openpyxl.load_workbook(path, read_only=self.read_only, data_only=self.data_only)
+            self._workbooks[path] = wb
+        return wb
+
+    def get_sheetnames(self, path):
+        return self.get_workbook(path).sheetnames
+
+    def get_worksheet(self, path, sheet_name=None):
+        """Retorna a planilha pedida (a ativa, se sheet_name não for informado)"""
+        wb = self.get_workbook(path)
+        return wb[sheet_name] if sheet_name else wb.active
+
+    def close(self):
+        for wb in self._workbooks.values():
+            if self.read_only:
+                wb.close()
+        self._workbooks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def normaliza_rotulo(texto):
+    """Chave de comparação de rótulos: sem acentos, caixa, parênteses e pontuação
+
+    Rótulos bilíngues ("Taxa de Ocupação | Occupancy Rate") geram uma chave
+    para o texto inteiro e uma para cada parte.
+    """
+    if not isinstance(texto, str):
+        return []
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii').casefold()
+    chaves = []
+    for parte in [texto] + re.split(r'[|/]', texto):
+        parte = re.sub(r'\([^)]*\)', ' ', parte)
+        parte = ' '.join(re.sub(r'[^a-z0-9%]+', ' ', parte).split())
+        if parte and parte not in chaves:
+            chaves.append(parte)
+    return chaves
+
+def open_file(path):
+    """Abre o arquivo com o aplicativo padrão do sistema"""
+    if sys.platform.startswith('win'):
+        os.startfile(str(path))
+    elif sys.platform.startswith('darwin'):
+        subprocess.run(['open', str(path)])
+    else:
+        subprocess.run(['xdg-open', str(path)])
+
+def render_metric_figure(paineis, output_path, dpi=300, titulo=None):
+    """Desenha os painéis (ver ReportProcessor.build_plot_panels) numa figura e salva em output_path
+
+    Usa a API orientada a objetos do matplotlib, sem o estado global do
+    pyplot, para poder rodar em processos paralelos. Cada painel é desenhado
+    com uma única chamada a plot sobre a matriz empresa x trimestre. O
+    formato do arquivo segue a extensão (png, svg, ...). Retorna output_path.
+    """
+    from matplotlib.figure import Figure
+
+    n_paineis = len(paineis)
+    n_cols = min(3, n_paineis)
+    n_rows = (n_paineis + n_cols - 1) // n_cols
+    fig = Figure(figsize=(15, 5*n_rows))
+    if titulo:
+        fig.suptitle(titulo, fontsize=16, fontweight='bold')
+    axes = fig.subplots(n_rows, n_cols, squeeze=False).flatten()
+    for ax, painel in zip(axes, paineis):
+        labels = painel['labels']
+        x = np.arange(len(labels))
+        # Acima de três empresas, as cores seguem pela paleta tab20 (a partir do vermelho)
+        ax.set_prop_cycle(color=CORES_GRAFICO + list(matplotlib.colormaps['tab20'].colors[6:]))
+        if len(painel['empresas']):
+            linhas = ax.plot(x, painel['valores'].T, linewidth=1.0)
+            for linha, empresa in zip(linhas, painel['empresas']):
+                linha.set_label(empresa)
+            ax.legend()
+        ax.set_title(f"{painel['metrica']}", fontweight='bold', fontsize=12)
+        ax.set_xlabel('Trimestre')
+        ax.set_ylabel('%')
+        ax.grid(True, alpha=0.3)
+        ax.set_xticks(painel['xticks'])
+        ax.set_xticklabels([labels[i] for i in painel['xticks']], rotation=45)
+    for ax in axes[n_paineis:]:
+        fig.delaxes(ax)
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
+    return output_path
+
+class ChartCache:
+    """Cache em disco das imagens de gráficos, indexado pela impressão digital dos dados
+
+    A chave é um SHA-256 das séries plotadas, rótulos e parâmetros de estilo;
+    imagens iguais são copiadas do cache em vez de redesenhadas. O diretório
+    é limitado por tamanho total e idade dos arquivos (os menos usados saem
+    primeiro).
+    """
+    # Incrementar ao mudar o desenho em render_metric_figure, invalidando o cache
+    VERSAO = 1
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, max_age_days=30):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600
+
+    def fingerprint(self, paineis, **estilo):
+        h = hashlib.sha256()
+        h.update(repr((self.VERSAO, sorted(estilo.items()), CORES_GRAFICO)).encode('utf-8'))
+        for painel in paineis:
+            h.update(repr((painel['metrica'], painel['empresas'], painel['labels'], painel['xticks'])).encode('utf-8'))
+            valores = np.ascontiguousarray(painel['valores'], dtype=np.float64)
+            h.update(repr(valores.shape).encode('utf-8'))
+            h.update(valores.tobytes())
+        return h.hexdigest()
+
+    def _path(self, key, suffix):
+        return self.cache_dir / f"{key}{suffix}"
+
+    def fetch(self, key, destino):
+        """Copia a imagem do cache para destino; False se não houver"""
+        destino = Path(destino)
+        origem = self._path(key, destino.suffix)
+        try:
+            shutil.copyfile(origem, destino)
+            os.utime(origem)  # Marca como usado recentemente
+        except FileNotFoundError:  # Ausente ou removida por evict de outra execução
+            return False
+        return True
+
+    def store(self, key, arquivo):
+        """Guarda a imagem via um temporário exclusivo: fetch simultâneo nunca lê um arquivo pela metade"""
+        arquivo = Path(arquivo)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        f = tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=f"{key}_", suffix='.tmp', delete=False)
+        try:
+            with f, open(arquivo, 'rb') as origem:
+                shutil.copyfileobj(origem, f)
+            os.replace(f.name, self._path(key, arquivo.suffix))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(f.name)
+            raise
+
+    def evict(self):
+        """Remove arquivos antigos e, acima do limite de tamanho, os menos usados"""
+        if not self.cache_dir.exists():
+            return
+        agora = time.time()
+        arquivos = []
+        for path in self.cache_dir.iterdir():
+            # Temporários são de store em andamento (de outra execução)
+            if not path.is_file() or path.suffix == '.tmp':
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if agora - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+            else:
+                arquivos.append((stat.st_mtime, stat.st_size, path))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, path in sorted(arquivos):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= tamanho
+
+class ExtractionCache:
+    """Cache persistente das séries extraídas de cada report
+
+    A chave é um SHA-256 do conteúdo do report, do mapa de células/rótulos lido
+    (get_row_refs), da aba/normalização e da versão da extração. O
+    manifest.json associa cada chave a um .npz com as séries em formato
+    binário (chaves empresa/métrica, índices de trimestre e valores).
+    """
+    # Incrementar ao mudar a extração (células, rótulos, normalização, conversão numérica)
+    VERSAO = 4
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.manifest_path = self.cache_dir / 'manifest.json'
+        self._manifest = None
+        # SHA-256 dos arquivos já lidos nesta execução: (caminho, tamanho, mtime) -> hash
+        self._digests = {}
+
+    def file_digest(self, path):
+        stat = os.stat(path)
+        chave = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if chave not in self._digests:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(bloco)
+            self._digests[chave] = h.hexdigest()
+        return self._digests[chave]
+
+    def key(self, fonte, refs):
+        h = hashlib.sha256()
+        h.update(repr((self.VERSAO, fonte['sheet'], fonte['normalize'], refs)).encode('utf-8'))
+        h.update(self.file_digest(fonte['input']).encode('ascii'))
+        return h.hexdigest()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._manifest = self._read_manifest()
+        return self._manifest
+
+    def _replace_atomically(self, destino, escrever, modo='wb', **kwargs):
+        """Grava via escrever(f) num temporário exclusivo da pasta do cache e troca por destino"""
+        f = tempfile.NamedTemporaryFile(modo, dir=self.cache_dir, prefix=f"{destino.stem}_", suffix='.tmp',
+                                        delete=False, **kwargs)
+        try:
+            with f:
+                escrever(f)
+            os.replace(f.name, destino)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(f.name)
+            raise
+
+    @contextlib.contextmanager
+    def _lock_manifest(self, espera=10.0, validade=60.0):
+        """Trava a atualização do manifest entre execuções simultâneas (arquivo manifest.lock)
+
+        Levanta TimeoutError se a trava não for obtida em `espera` segundos;
+        travas com mais de `validade` segundos (execução interrompida) são removidas.
+        """
+        trava = self.cache_dir / 'manifest.lock'
+        limite = time.monotonic() + espera
+        while True:
+            try:
+                fd = os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(trava).st_mtime > validade:
+                        os.remove(trava)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > limite:
+                    raise TimeoutError(f"Trava do cache de extração ocupada: {trava}")
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(trava)
+
+    def load(self, key):
+        """Séries {(empresa, métrica): {Quarter: valor}} da chave; None se não houver"""
+        entrada = self.manifest.get(key)
+        if entrada is None:
+            # Entrada gravada por outra execução depois da leitura do manifest
+            if not (self.cache_dir / f"{key}.npz").exists():
+                return None
+            entrada = {'npz': f"{key}.npz"}
+        try:
+            with np.load(self.cache_dir / entrada['npz'], allow_pickle=False) as dados:
+                chaves, tamanhos = dados['chaves'], dados['tamanhos']
+                trimestres, valores = dados['trimestres'], dados['valores']
+        except (OSError, KeyError, ValueError):
+            return None
+        series = {}
+        fim = 0
+        for chave, tamanho in zip(chaves.tolist(), tamanhos.tolist()):
+            empresa, metrica = chave.split('\t')
+            inicio, fim = fim, fim + tamanho
+            series[(empresa, metrica)] = {Quarter.from_index(t): v for t, v in
+                                          zip(trimestres[inicio:fim].tolist(), valores[inicio:fim].tolist())}
+        return series
+
+    def store(self, key, series, fonte):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        arquivo = f"{key}.npz"
+        pares = list(series.items())
+        self._replace_atomically(self.cache_dir / arquivo, lambda f: np.savez_compressed(
+            f,
+            chaves=np.array([f"{empresa}\t{metrica}" for (empresa, metrica), _ in pares], dtype=str),
+            tamanhos=np.array([len(serie) for _, serie in pares], dtype=np.int64),
+            trimestres=np.array([t.index for _, serie in pares for t in serie], dtype=np.int64),
+            valores=np.array([v for _, serie in pares for v in serie.values()], dtype=np.float64)))
+        entrada = {'npz': arquivo, 'empresa': fonte['name'], 'report': os.path.abspath(fonte['input']),
+                   'criado': datetime.datetime.now().isoformat(timespec='seconds')}
+        try:
+            with self._lock_manifest():
+                # Relê o manifest: execuções simultâneas podem ter gravado outras entradas desde a leitura
+                manifest = self._read_manifest()
+                manifest[key] = entrada
+                self._replace_atomically(self.manifest_path,
+                                         lambda f: json.dump(manifest, f, ensure_ascii=False, indent=1),
+                                         modo='w', encoding='utf-8')
+        except TimeoutError as e:
+            # O .npz já gravado continua sendo encontrado por load
+            logger.warning("Manifest do cache de extração não atualizado: %s", e)
+            return
+        self._manifest = manifest
+
+class ProcessamentoCancelado(Exception):
+    """Processamento interrompido a pedido do usuário (ver ReportProcessor.cancelar)"""
 
 class ReportProcessor:
     """Classe para processar os relatórios das empresas"""
@@ -36,159 +647,438 @@ class ReportProcessor:
     def __init__(self):
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
         os.chdir(self.script_dir)
-        
-    def treat_data_iguatemi(self, filepath, output_path):
-        """Processa dados da Iguatemi"""
-        if not os.path.exists(filepath):
-            raise FileNotFoundError(f"Arquivo não encontrado: {filepath}")
-        aba_a_manter = 'Indicadores | Indicators'
-        temp_csv = os.path.join(self.script_dir, "temp_iguatemi.csv")
-        wb = openpyxl.load_workbook(filepath, data_only=True)
-        if aba_a_manter not in wb.sheetnames:
-            available_sheets = ", ".join(wb.sheetnames)
-            raise ValueError(f"Aba '{aba_a_manter}' não encontrada. Abas disponíveis: {available_sheets}")
-        ws = wb[aba_a_manter]
-        with open(temp_csv, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            for row in ws.iter_rows(values_only=True):
-                new_row = []
-                for cell in row:
-                    if isinstance(cell, float):
-                        cell = str(cell).replace('.', ',')
-                    elif isinstance(cell, str):
-                        cell = cell.replace('.', ',')
-                    new_row.append(cell)
-                writer.writerow(new_row)
-        wb_out = openpyxl.Workbook()
-        ws_out = wb_out.active
-        ws_out.title = aba_a_manter
-        with open(temp_csv, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                ws_out.append(row)
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        wb_out.save(output_path)
-        if os.path.exists(temp_csv):
-            os.remove(temp_csv)
-        debug_print(f"Iguatemi processado: {output_path}")
-
-    def treat_data_allos(self, filepath, output_path):
-        """Processa dados da Allos"""
-        if not os.path.exists(filepath):
-            raise FileNotFoundError(f"Arquivo não encontrado: {filepath}")
-        
-        aba_a_manter = 'Indicadores'
-        wb = openpyxl.load_workbook(filepath)
+        # Índice de inflação usado para descontar cada métrica (colunas de inflation.codigos)
+        self.deflatores = {'SSS': 'IPCA', 'SSR': 'IGPM'}
+        # Adaptadores das empresas processadas (cópia de EMPRESAS na criação)
+        self.empresas = {nome: dict(adaptador) for nome, adaptador in EMPRESAS.items()}
+        # Rótulos aceitos para cada métrica, por empresa (ver get_rows_values_by_label);
+        # ex.: self.rotulos['Allos']['SSS'] += ('SSS Total',)
+        self.rotulos = {nome: {**ROTULOS_PADRAO, **adaptador['rotulos']} for nome, adaptador in self.empresas.items()}
+        # Opções do gráfico (ver plot_all_metrics); ex.: dpi=100 e abrir=False para rascunho sem janela
+        self.opcoes_grafico = {'dpi': 300, 'formato': None, 'abrir': True, 'por_metrica': False, 'parallel': False,
+                               'cache': True, 'png': True, 'excel': True}
+        # Cubo empresa x métrica x trimestre da última consolidação
+        self.cube = None
+        # Inflação mensal e trimestral (DataFrames de inflation.get_inflation_data)
+        self.inflacao_mensal = None
+        self.inflacao_trimestral = None
+        # Se o BCB já foi consultado (com ou sem sucesso); evita repetir uma consulta que falhou
+        self.inflacao_consultada = False
+        # Reports de entrada por empresa (o modo linha de comando aceita outros caminhos)
+        self.reports = {nome: os.path.join('reports', adaptador['arquivo']) for nome, adaptador in self.empresas.items()}
+        # Pastas de saída do Consolidado.xlsx e da imagem dos gráficos
+        self.destino = Path.home() / "Desktop"
+        self.pasta_graficos = Path(self.script_dir)
+        # Deixa também uma cópia em data_treated/Consolidado.xlsx (pasta comum a todas as execuções)
+        self.copia_data_treated = True
+        # Medição das etapas (ver medir): memoria liga o tracemalloc; perfil é uma pasta
+        # para os dumps cProfile/pstats de cada etapa; relatorio é o caminho do JSON da execução
+        self.opcoes_medicao = {'memoria': False, 'perfil': None, 'relatorio': None}
+        # Medições de cada etapa do último processamento e, resumido, o tempo de relógio (s)
+        self.medicoes = {}
+        self.tempos = {}
+        # Séries já extraídas de reports idênticos (None desativa o cache)
+        self.cache_extracao = ExtractionCache(os.path.join(self.script_dir, 'extract_cache'))
+        # Pedido de cancelamento (ver cancelar) e callback de progresso (0-100) do processamento em curso
+        self.cancelamento = threading.Event()
+        self.progress_callback = None
+        self._faixas = {}
+        self._faixa = (0.0, 0.0)
+        self._progresso = 0.0
 
-        if aba_a_manter not in wb.sheetnames:
-            available_sheets = ", ".join(wb.sheetnames)
-            raise ValueError(f"Aba '{aba_a_manter}' não encontrada. Abas disponíveis: {available_sheets}")
+    def __getstate__(self):
+        # As tarefas do pool recebem uma cópia do processador, sem o evento e o callback
+        estado = self.__dict__.copy()
+        estado['cancelamento'] = None
+        estado['progress_callback'] = None
+        return estado
 
-        # Remover todas as abas que não sejam a desejada
-        for aba in wb.sheetnames[:]:
-            if aba != aba_a_manter:
-                wb.remove(wb[aba])
+    def cancelar(self):
+        """Pede o cancelamento do processamento em curso (pode ser chamado de outra thread)
 
-        # Criar diretório se não existir
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Salvar as alterações
-        wb.save(output_path)
-        debug_print(f"Allos processado: {output_path}")
+        O pedido é atendido no próximo ponto de verificação: início de cada
+        etapa, fim de cada tarefa por empresa e a cada BLOCO_LINHAS linhas
+        lidas no processo principal. O processamento termina com
+        ProcessamentoCancelado, sem gravar o consolidado parcial. O pedido
+        vale até self.cancelamento.clear().
+        """
+        self.cancelamento.set()
+
+    def etapas_consolidacao(self, inflacao=True):
+        """Etapas de write_consolidado (e da extração que o precede), na ordem em que rodam"""
+        etapas = ['extracao', 'cubo', 'planilha']
+        if inflacao:
+            etapas += ['abas_inflacao', 'deflacao']
+        if self.opcoes_grafico['excel']:
+            etapas.append('graficos_excel')
+        etapas.append('gravacao')
+        if self.opcoes_grafico['png']:
+            etapas.append('grafico_png')
+        return etapas + ['copia']
+
+    def planejar_progresso(self, etapas, progress_callback=None):
+        """Divide 0-100 entre as etapas previstas, proporcionalmente a PESO_ETAPAS"""
+        self.progress_callback = progress_callback
+        self._progresso = 0.0
+        total = sum(PESO_ETAPAS[etapa] for etapa in etapas) or 1
+        inicio = 0.0
+        self._faixas = {}
+        for etapa in etapas:
+            fim = inicio + 100.0 * PESO_ETAPAS[etapa] / total
+            self._faixas[etapa] = (inicio, fim)
+            inicio = fim
+        self._faixa = (0.0, 0.0)
+
+    def avancar(self, fracao=None):
+        """Ponto de verificação: levanta ProcessamentoCancelado se pedido e publica o progresso
+
+        fracao (0-1) é o quanto da faixa atual (etapa, ou tarefa dentro da
+        etapa) já foi feito. O progresso publicado nunca diminui.
+        """
+        if self.cancelamento is not None and self.cancelamento.is_set():
+            raise ProcessamentoCancelado("Processamento cancelado pelo usuário")
+        if fracao is None or self.progress_callback is None:
+            return
+        inicio, fim = self._faixa
+        valor = round(inicio + (fim - inicio) * min(max(fracao, 0.0), 1.0), 1)
+        if valor > self._progresso:
+            self._progresso = valor
+            self.progress_callback(valor)
+
+    def iniciar_medicao(self):
+        """Zera as medições; chamado no início de cada processamento"""
+        self.medicoes = {}
+        self.tempos = {}
+        self._inicio_execucao = (time.perf_counter(), datetime.datetime.now())
+        self._tracemalloc_proprio = self.opcoes_medicao['memoria'] and not tracemalloc.is_tracing()
+        if self._tracemalloc_proprio:
+            tracemalloc.start()
+
+    def finalizar_medicao(self, sucesso, **parametros):
+        """Encerra a medição e grava o relatório JSON, se configurado"""
+        inicio, inicio_data = getattr(self, '_inicio_execucao', (time.perf_counter(), datetime.datetime.now()))
+        total = time.perf_counter() - inicio
+        if getattr(self, '_tracemalloc_proprio', False):
+            tracemalloc.stop()
+            self._tracemalloc_proprio = False
+        if self.opcoes_medicao['relatorio']:
+            try:
+                self.write_run_report(self.opcoes_medicao['relatorio'], sucesso, total, inicio_data, **parametros)
+            except OSError as e:
+                debug_print(f"Erro ao gravar relatório de execução: {e}")
+        return total
+
+    @contextlib.contextmanager
+    def medir(self, etapa):
+        """Mede o bloco como a etapa `etapa`, acumulando em self.medicoes[etapa]
+
+        Registra tempo de relógio, CPU do processo, CPU de processos filhos já
+        encerrados (pool de processos) e, com opcoes_medicao['memoria'], o pico
+        de memória alocada pelo Python no processo principal (tracemalloc).
+        Com opcoes_medicao['perfil'] grava o cProfile da etapa. As etapas não
+        devem ser aninhadas. Cada etapa é um ponto de verificação de
+        cancelamento e ocupa sua faixa da barra de progresso (ver planejar_progresso).
+        """
+        self.avancar()
+        self._faixa = self._faixas.get(etapa, (self._progresso, self._progresso))
+        memoria = self.opcoes_medicao['memoria'] and tracemalloc.is_tracing()
+        if memoria:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        perfil = None
+        if self.opcoes_medicao['perfil']:
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:  # Outro perfilador ativo
+                perfil = None
+        inicio, inicio_cpu, inicio_filhos = time.perf_counter(), time.process_time(), os.times()
+        try:
+            yield
+        finally:
+            fim_filhos = os.times()
+            medicao = self.medicoes.setdefault(etapa, {'chamadas': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'cpu_filhos_s': 0.0})
+            medicao['chamadas'] += 1
+            medicao['wall_s'] += time.perf_counter() - inicio
+            medicao['cpu_s'] += time.process_time() - inicio_cpu
+            medicao['cpu_filhos_s'] += (fim_filhos.children_user - inicio_filhos.children_user
+                                        + fim_filhos.children_system - inicio_filhos.children_system)
+            if memoria:
+                pico = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+                medicao['pico_memoria_mb'] = max(medicao.get('pico_memoria_mb', 0.0), pico)
+            if perfil is not None:
+                perfil.disable()
+                self.dump_profile(etapa, perfil, medicao['chamadas'])
+            self.tempos[etapa] = medicao['wall_s']
+        self.avancar(1.0)
+
+    def dump_profile(self, etapa, perfil, chamada=1):
+        """Grava <etapa>.prof (pstats) e <etapa>.txt (funções mais custosas) na pasta de perfil"""
+        pasta = Path(self.opcoes_medicao['perfil'])
+        pasta.mkdir(parents=True, exist_ok=True)
+        nome = etapa if chamada == 1 else f"{etapa}_{chamada}"
+        perfil.dump_stats(str(pasta / f"{nome}.prof"))
+        with open(pasta / f"{nome}.txt", 'w', encoding='utf-8') as f:
+            pstats.Stats(perfil, stream=f).sort_stats('cumulative').print_stats(30)
+
+    def write_run_report(self, caminho, sucesso, total, inicio, **parametros):
+        """Grava o relatório JSON da execução: parâmetros, ambiente e medições por etapa"""
+        relatorio = {
+            'inicio': inicio.isoformat(timespec='seconds'),
+            'sucesso': sucesso,
+            'total_s': round(total, 6),
+            'parametros': parametros,
+            'empresas': list(self.empresas),
+            'etapas': {etapa: {chave: round(valor, 6) if isinstance(valor, float) else valor
+                               for chave, valor in medicao.items()}
+                       for etapa, medicao in self.medicoes.items()},
+            'ambiente': {'python': sys.version.split()[0], 'plataforma': sys.platform, 'cpus': os.cpu_count()},
+        }
+        caminho = Path(caminho)
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = caminho.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, caminho)
 
-    def treat_data_multiplan(self, filepath, output_path):
-        """Processa dados da Multiplan"""
+    def normaliza_celula(self, cell):
+        """Converte a célula para texto com vírgula como separador decimal"""
+        if cell is None:
+            return None
+        if isinstance(cell, float):
+            return str(cell).replace('.', ',')
+        if isinstance(cell, str):
+            return cell.replace('.', ',')
+        return str(cell)
+
+    def treat_sheet_streaming(self, filepath, output_path, aba_a_manter, normalize=True):
+        """Copia a aba desejada numa única passada, normalizando os decimais (se normalize)
+
+        Lê com uma planilha read-only e escreve por um workbook write-only, sem
+        arquivo intermediário em disco; o uso de memória não depende do tamanho
+        da aba. Serve a todas as empresas (ver get_files_to_process).
+        """
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"Arquivo não encontrado: {filepath}")
-        
-        aba_a_manter = 'Indicadores | Indicators'
-        temp_csv = os.path.join(self.script_dir, "temp_multiplan.csv")
+        wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            if aba_a_manter not in wb.sheetnames:
+                available_sheets = ", ".join(wb.sheetnames)
+                raise ValueError(f"Aba '{aba_a_manter}' não encontrada. Abas disponíveis: {available_sheets}")
+            ws = wb[aba_a_manter]
+            # As dimensões gravadas pelas empresas nem sempre são confiáveis (só estimam o progresso)
+            estimativa = ws.max_row or 0
+            ws.reset_dimensions()
+            wb_out = openpyxl.Workbook(write_only=True)
+            ws_out = wb_out.create_sheet(aba_a_manter)
+            for row_idx, row in enumerate(ws.iter_rows(values_only=True), 1):
+                ws_out.append([self.normaliza_celula(cell) for cell in row] if normalize else row)
+                if row_idx % BLOCO_LINHAS == 0:
+                    self.avancar(row_idx / estimativa if estimativa else None)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            wb_out.save(output_path)
+        finally:
+            wb.close()
 
-        # Extrair aba para CSV
-        wb = openpyxl.load_workbook(filepath, data_only=True)
-        
-        if aba_a_manter not in wb.sheetnames:
-            available_sheets = ", ".join(wb.sheetnames)
-            raise ValueError(f"Aba '{aba_a_manter}' não encontrada. Abas disponíveis: {available_sheets}")
-        
-        ws = wb[aba_a_manter]
-        with open(temp_csv, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            for row in ws.iter_rows(values_only=True):
-                # Troca pontos por vírgulas em strings e floats
-                new_row = []
-                for cell in row:
-                    if isinstance(cell, float):
-                        cell = str(cell).replace('.', ',')
-                    elif isinstance(cell, str):
-                        cell = cell.replace('.', ',')
-                    new_row.append(cell)
-                writer.writerow(new_row)
-
-        # Converter CSV de volta para Excel
-        wb_out = openpyxl.Workbook()
-        ws_out = wb_out.active
-        ws_out.title = aba_a_manter
-        with open(temp_csv, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                ws_out.append(row)
-        
-        # Criar diretório se não existir
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        wb_out.save(output_path)
+    def get_rows_values_from_cells(self, ws, refs):
+        """Extrai várias linhas numa única passada pela planilha
 
-        # Remover arquivo temporário
-        if os.path.exists(temp_csv):
-            os.remove(temp_csv)
-        
-        debug_print(f"Multiplan processado: {output_path}")
-
-    def get_row_values_from_cell(self, ws, cell_ref, novo_nome):
-        """Extrai valores da linha a partir de uma célula"""
-        col = openpyxl.utils.column_index_from_string(''.join(filter(str.isalpha, cell_ref)))
-        row = int(''.join(filter(str.isdigit, cell_ref)))
-        max_col = ws.max_column
-        values = []
-        for i in range(col, max_col + 1):
-            value = ws.cell(row=row, column=i).value
-            if i == col:
-                values.append(novo_nome)
+        refs é uma lista de (célula_inicial, nome_linha); retorna um dicionário
+        nome_linha -> [nome_linha, valores à direita da célula...].
+        """
+        pedidos = {}
+        for cell_ref, novo_nome in refs:
+            col = openpyxl.utils.column_index_from_string(''.join(filter(str.isalpha, cell_ref)))
+            row = int(''.join(filter(str.isdigit, cell_ref)))
+            pedidos.setdefault(row, []).append((col, novo_nome))
+        resultados = {}
+        if not pedidos:
+            return resultados
+        min_row, max_row = min(pedidos), max(pedidos)
+        for row_idx, row in enumerate(ws.iter_rows(min_row=min_row, max_row=max_row, values_only=True), min_row):
+            for col, novo_nome in pedidos.get(row_idx, []):
+                resultados[novo_nome] = [novo_nome] + list(row[col:])
+            if row_idx % BLOCO_LINHAS == 0:
+                self.avancar((row_idx - min_row + 1) / (max_row - min_row + 1))
+        # Linhas além do fim da planilha ficam vazias
+        for row_pedida in pedidos.values():
+            for _, novo_nome in row_pedida:
+                resultados.setdefault(novo_nome, [novo_nome])
+        return resultados
+
+    def get_rows_values_by_label(self, ws, refs, rotulos):
+        """Extrai as linhas localizando-as pelo rótulo, numa única passada pela planilha
+
+        refs é uma lista de (célula_inicial, nome_linha) como em
+        get_rows_values_from_cells; a coluna da célula é a coluna de rótulos e
+        rotulos mapeia a métrica (início de nome_linha) para os rótulos aceitos.
+        Vale a linha da célula de refs se o rótulo dela for um dos aceitos;
+        senão, a ocorrência do rótulo mais próxima dela (rótulos genéricos como
+        "SSS" ou "Trimestre" se repetem em outros blocos da aba). Métricas sem
+        rótulo encontrado usam a célula de refs. A passada termina quando
+        nenhuma linha adiante pode ficar mais perto de alguma métrica.
+
+        Abas com vários cabeçalhos de trimestres (um por bloco) trazem, para
+        cada métrica, o cabeçalho mais próximo acima dela na chave
+        ('Trimestres', nome_linha) quando ele não é o cabeçalho da empresa
+        (ver build_series).
+        """
+        pedidos = []
+        for cell_ref, novo_nome in refs:
+            col = openpyxl.utils.column_index_from_string(''.join(filter(str.isalpha, cell_ref)))
+            row = int(''.join(filter(str.isdigit, cell_ref)))
+            chaves = {chave for rotulo in rotulos.get(novo_nome.split(' ', 1)[0], ())
+                      for chave in normaliza_rotulo(rotulo)}
+            pedidos.append((col, row, novo_nome, chaves))
+        cabecalho = next((pedido for pedido in pedidos if pedido[2].startswith('Trimestres')), None)
+        colunas = {col for col, _, _, _ in pedidos}
+        linhas_ref = {row for _, row, _, _ in pedidos}
+
+        melhores = {}    # nome_linha -> (distância até a célula de refs, linha, valores)
+        cabecalhos = []  # (linha, valores) de cada linha com rótulo de trimestres, em ordem
+        por_numero = {}  # linhas das células de refs, para o fallback
+        for row_idx, row in enumerate(ws.iter_rows(values_only=True), 1):
+            if row_idx in linhas_ref:
+                por_numero[row_idx] = row
+            chaves_linha = {col: set(normaliza_rotulo(row[col - 1])) if col <= len(row) else set() for col in colunas}
+            for col, row_ref, novo_nome, chaves in pedidos:
+                if chaves_linha[col] & chaves:
+                    distancia = abs(row_idx - row_ref)
+                    if novo_nome not in melhores or distancia < melhores[novo_nome][0]:
+                        melhores[novo_nome] = (distancia, row_idx, row)
+            if cabecalho and chaves_linha[cabecalho[0]] & cabecalho[3]:
+                cabecalhos.append((row_idx, row))
+            if all(novo_nome in melhores and row_idx - row_ref >= melhores[novo_nome][0]
+                   for _, row_ref, novo_nome, _ in pedidos):
+                break
+            if row_idx % BLOCO_LINHAS == 0:
+                # Os rótulos costumam estar perto das células de refs
+                self.avancar(row_idx / max(linhas_ref))
+
+        resultados = {}
+        linhas = {}
+        for col, row, novo_nome, chaves in pedidos:
+            achado = melhores.get(novo_nome)
+            if achado is None:
+                logger.debug("Rótulo de %s não encontrado; usando a célula %s%d",
+                             novo_nome, openpyxl.utils.get_column_letter(col), row)
+                linhas[novo_nome], valores = row, por_numero.get(row)
             else:
-                values.append(value)
-        return values
+                _, linhas[novo_nome], valores = achado
+                if linhas[novo_nome] != row:
+                    logger.warning("%s encontrado pelo rótulo na linha %d (referência: linha %d)",
+                                   novo_nome, linhas[novo_nome], row)
+            resultados[novo_nome] = [novo_nome] + (list(valores[col:]) if valores is not None else [])
+
+        # Cabeçalho de trimestres do bloco de cada métrica: o mais próximo acima dela
+        if cabecalho and cabecalhos:
+            col_cabecalho, _, nome_cabecalho, _ = cabecalho
+            for _, _, novo_nome, _ in pedidos:
+                acima = [(linha, valores) for linha, valores in cabecalhos if linha <= linhas[novo_nome]]
+                if novo_nome == nome_cabecalho or not acima or acima[-1][0] == linhas[nome_cabecalho]:
+                    continue
+                linha, valores = acima[-1]
+                logger.info("%s usa o cabeçalho de trimestres da linha %d (cabeçalho da empresa: linha %d)",
+                            novo_nome, linha, linhas[nome_cabecalho])
+                chave = ('Trimestres', novo_nome)
+                resultados[chave] = [chave] + list(valores[col_cabecalho:])
+        return resultados
+
+    def extract_file_rows(self, path, refs, fonte=None, cache=None):
+        """Extrai as linhas pedidas (refs) de um único arquivo
+
+        fonte é a entrada de get_files_to_process correspondente; quando
+        informada, as linhas são lidas direto do report original (parando na
+        última linha pedida). Os valores numéricos seguem como números: a
+        vírgula decimal de treat_sheet_streaming só existe na saída de debug,
+        e to_number_or_nan aceita os dois separadores nos textos.
+        """
+        if cache is None:
+            with WorkbookCache() as cache:
+                return self.extract_file_rows(path, refs, fonte, cache)
+        rotulos = self.rotulos.get(refs[0][1].split(' ', 1)[-1]) if refs else None
+        if fonte is None:
+            debug_print(f"Lendo {len(refs)} linhas de {path}")
+            ws = cache.get_worksheet(path)
+            if rotulos:
+                return self.get_rows_values_by_label(ws, refs, rotulos)
+            return self.get_rows_values_from_cells(ws, refs)
+        debug_print(f"Lendo {len(refs)} linhas direto de {fonte['input']}")
+        if fonte['sheet'] not in cache.get_sheetnames(fonte['input']):
+            available_sheets = ", ".join(cache.get_sheetnames(fonte['input']))
+            raise ValueError(f"Aba '{fonte['sheet']}' não encontrada. Abas disponíveis: {available_sheets}")
+        ws = cache.get_worksheet(fonte['input'], fonte['sheet'])
+        ws.reset_dimensions()
+        if rotulos:
+            return self.get_rows_values_by_label(ws, refs, rotulos)
+        return self.get_rows_values_from_cells(ws, refs)
+
+    def run_company_tasks(self, tasks, parallel=False, on_done=None):
+        """Executa uma tarefa independente por empresa/arquivo
+
+        tasks é uma lista de (nome, função, args). Com parallel=True as tarefas
+        rodam num pool de processos. Retorna (resultados, erros), dicionários
+        por nome; on_done(nome, concluídas, total) é chamado no processo
+        principal à medida que cada tarefa termina. Cada tarefa concluída avança
+        o progresso da etapa atual; um cancelamento (ver cancelar) interrompe
+        as tarefas seguintes.
+        """
+        resultados = {}
+        erros = {}
+        total = len(tasks)
+        if not parallel or total < 2:
+            inicio, fim = faixa = self._faixa
+            try:
+                for i, (nome, func, args) in enumerate(tasks, 1):
+                    self.avancar()
+                    # Faixa da tarefa, para o progresso por bloco de linhas dentro dela
+                    self._faixa = (inicio + (fim - inicio) * (i - 1) / total, inicio + (fim - inicio) * i / total)
+                    try:
+                        resultados[nome] = func(*args)
+                    except ProcessamentoCancelado:
+                        raise
+                    except Exception as e:
+                        erros[nome] = e
+                        logger.error("Erro ao processar %s", nome, exc_info=True)
+                    self.avancar(1.0)
+                    if on_done:
+                        on_done(nome, i, total)
+            finally:
+                self._faixa = faixa
+            return resultados, erros
+
+        max_workers = min(total, os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_configurar_logging_worker) as executor:
+            futuros = {executor.submit(func, *args): nome for nome, func, args in tasks}
+            for i, futuro in enumerate(as_completed(futuros), 1):
+                nome = futuros[futuro]
+                try:
+                    resultados[nome] = futuro.result()
+                except Exception as e:
+                    erros[nome] = e
+                    logger.error("Erro ao processar %s: %s", nome, e)
+                try:
+                    self.avancar(i / total)
+                except ProcessamentoCancelado:
+                    # As tarefas em andamento terminam; as que ainda não começaram são descartadas
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+                if on_done:
+                    on_done(nome, i, total)
+        return resultados, erros
 
     def padroniza_trimestres(self, trimestre_raw):
-        """Padroniza nomes dos trimestres"""
-        trimestres = []
-        for col in trimestre_raw:
-            if isinstance(col, str):
-                match = re.match(r"(\d)[TQº]?\s?(\d{2,4})", col, re.IGNORECASE)
-                if match:
-                    trimestre = f"{match.group(1)}Q{match.group(2)[-2:]}"
-                    trimestres.append(trimestre)
-                else:
-                    trimestres.append(col)
-            else:
-                trimestres.append(col)
+        """Converte o cabeçalho de trimestres em Quarter (None nas colunas que não são trimestres)"""
+        trimestres = [Quarter.parse(col) for col in trimestre_raw]
+        descartadas = [col for col, t in zip(trimestre_raw, trimestres)
+                       if t is None and col is not None and str(col).strip()]
+        if descartadas:
+            logger.warning("Colunas do cabeçalho não reconhecidas como trimestre (ignoradas): %s", descartadas)
         return trimestres
 
     def align_trimestres(self, header, valores):
         """Alinha trimestres com valores"""
-        return {t: v for t, v in zip(header, valores)}
-
-    def sort_trimestres(self, trimestres):
-        """Ordena trimestres cronologicamente"""
-        def trimestre_key(t):
-            m = re.match(r"(\d)Q(\d{2})", str(t))
-            if m:
-                trimestre = int(m.group(1))
-                ano = int(m.group(2))
-                ano += 2000 if ano < 80 else 1900
-                return (ano, trimestre)
-            return (9999, 9)
-        return sorted(trimestres, key=trimestre_key)
+        return {t: v for t, v in zip(header, valores) if t is not None}
 
     def round_val(self, val):
         """Arredonda valores"""
@@ -198,53 +1088,66 @@ class ReportProcessor:
         except (ValueError, TypeError):
             return val
 
-    def to_percent_or_nan(self, val):
+    def update_inflation(self):
+        """Carrega a inflação mensal/trimestral do BCB em memória
+
+        Retorna None em caso de sucesso ou a exceção ocorrida; nesse caso as
+        abas e linhas que dependem da inflação não são geradas.
+        """
+        self.inflacao_consultada = True
         try:
-            num = float(str(val).replace(',', '.'))
-            valor = round(num * 100, 2)
-            valor_str = f"{valor:.2f}".replace('.', ',')
-            return f"{valor_str}%"
-        except (ValueError, TypeError):
-            return "NaN"
+            self.inflacao_mensal, self.inflacao_trimestral = inflation.get_inflation_data()
+            debug_print("Dados de inflação atualizados.")
+            return None
+        except Exception as e:
+            debug_print(f"Erro ao atualizar inflação: {e}")
+            logger.error("Erro ao atualizar inflação", exc_info=True)
+            return e
 
-    def process_files(self, progress_callback=None, status_callback=None):
-        """Processa todos os arquivos"""
+    def get_files_to_process(self):
+        """Reports de entrada, aba relevante e saída tratada de cada empresa"""
+        return [
+            {
+                'input': self.reports.get(nome, os.path.join('reports', adaptador['arquivo'])),
+                'output': os.path.join('data_treated', adaptador['tratado']),
+                'sheet': adaptador['aba'],
+                'normalize': adaptador['normalizar'],
+                'name': nome
+            }
+            for nome, adaptador in self.empresas.items()
+        ]
+
+    def process_files(self, progress_callback=None, status_callback=None, save_treated=False, parallel=False,
+                      inflacao=True):
+        """Processa todos os arquivos
+
+        Com save_treated=True os arquivos intermediários de data_treated são
+        gerados (útil para debug) e a consolidação é feita a partir deles.
+        Com parallel=True cada empresa é tratada/lida num processo separado.
+        Com inflacao=False o BCB não é consultado e as abas/linhas que
+        dependem da inflação não são geradas. Os tempos de cada etapa ficam
+        em self.tempos. progress_callback recebe o progresso (0-100) a cada
+        etapa, tarefa por empresa e bloco de linhas; após cancelar() o
+        processamento é interrompido e retorna False.
+        """
+        self.iniciar_medicao()
+        etapas = (['inflacao'] if inflacao else []) + (['tratamento'] if save_treated else [])
+        self.planejar_progresso(etapas + self.etapas_consolidacao(inflacao), progress_callback)
+        sucesso = False
         try:
-            # Executar inflation.py antes de tudo
-            if status_callback:
-                status_callback("Atualizando dados de inflação...")
-            try:
-                subprocess.run(['python', 'inflation.py'], check=True)
-                debug_print("inflation.py executado com sucesso.")
-            except Exception as e:
-                debug_print(f"Erro ao executar inflation.py: {e}")
+            # Atualizar a inflação antes de tudo
+            if inflacao:
                 if status_callback:
-                    status_callback(f"Erro ao atualizar inflação: {e}")
+                    status_callback("Atualizando dados de inflação...")
+                with self.medir('inflacao'):
+                    erro_inflacao = self.update_inflation()
+                if erro_inflacao and status_callback:
+                    status_callback(f"Erro ao atualizar inflação: {erro_inflacao}")
             
             if status_callback:
                 status_callback("Iniciando processamento dos arquivos...")
             
-            # Definir os caminhos dos arquivos
-            files_to_process = [
-                {
-                    'input': os.path.join('reports', 'Iguatemi Planilha 1T25.xlsx'),
-                    'output': os.path.join('data_treated', 'iguatemi_data.xlsx'),
-                    'function': self.treat_data_iguatemi,
-                    'name': 'Iguatemi'
-                },
-                {
-                    'input': os.path.join('reports', 'Allos Planilha 1T25.xlsx'),
-                    'output': os.path.join('data_treated', 'allos_data.xlsx'),
-                    'function': self.treat_data_allos,
-                    'name': 'Allos'
-                },
-                {
-                    'input': os.path.join('reports', 'Multiplan Planilha 1T25.xlsx'),
-                    'output': os.path.join('data_treated', 'Multiplan_data.xlsx'),
-                    'function': self.treat_data_multiplan,
-                    'name': 'Multiplan'
-                }
-            ]
+            files_to_process = self.get_files_to_process()
             
             # Verificar se todos os arquivos de entrada existem
             missing_files = []
@@ -255,19 +1158,30 @@ class ReportProcessor:
             if missing_files:
                 raise FileNotFoundError(f"Arquivos não encontrados: {', '.join(missing_files)}")
             
-            # Processar cada arquivo
-            for i, file_info in enumerate(files_to_process):
+            # Arquivos de data_treated só são gerados como saída de debug;
+            # por padrão a consolidação lê direto dos reports originais
+            if save_treated:
+                def on_done(nome, concluidas, total):
+                    if status_callback:
+                        status_callback(f"{nome} processado ({concluidas}/{total})")
+
                 if status_callback:
-                    status_callback(f"Processando {file_info['name']}...")
-                file_info['function'](file_info['input'], file_info['output'])
-                if progress_callback:
-                    progress_callback((i + 1) * 25)  # 25% por arquivo
+                    nomes = ", ".join(f['name'] for f in files_to_process)
+                    status_callback(f"Processando {nomes}...")
+                # Reports já extraídos antes (mesmo conteúdo) não precisam ser tratados
+                tasks = [(f['name'], self.treat_sheet_streaming, (f['input'], f['output'], f['sheet'], f['normalize']))
+                         for f in files_to_process
+                         if self.cached_series(f) is None]
+                with self.medir('tratamento'):
+                    _, erros = self.run_company_tasks(tasks, parallel, on_done)
+                if erros:
+                    raise RuntimeError("Falha no tratamento: " + "; ".join(f"{nome}: {e}" for nome, e in erros.items()))
             
             if status_callback:
                 status_callback("Consolidando dados...")
             
             # Consolidar dados
-            self.consolidate_data()
+            self.consolidate_data(direct=not save_treated, parallel=parallel, inflacao=inflacao)
             
             if progress_callback:
                 progress_callback(100)
@@ -275,71 +1189,87 @@ class ReportProcessor:
             if status_callback:
                 status_callback("Processamento concluído!")
             
+            sucesso = True
             return True
-            
+
+        except ProcessamentoCancelado:
+            debug_print("Processamento cancelado pelo usuário")
+            if status_callback:
+                status_callback("Processamento cancelado")
+            return False
         except Exception as e:
             debug_print(f"ERRO durante o processamento: {e}")
             if status_callback:
                 status_callback(f"Erro: {str(e)}")
-            logging.error("Erro crítico", exc_info=True)
+            logger.error("Erro crítico", exc_info=True)
             return False
+        finally:
+            self.progress_callback = None
+            self.finalizar_medicao(sucesso, modo='process_files', save_treated=save_treated,
+                                   parallel=parallel, inflacao=inflacao)
 
-    def consolidate_data(self):
-        """Consolida os dados das três empresas"""
-        empresas_info = [
-            # (caminho, célula_inicial, nome_linha)
-            (os.path.join("data_treated", "allos_data.xlsx"), "B17", "Trimestres Allos"),
-            (os.path.join("data_treated", "allos_data.xlsx"), "B22", "SSS Allos"),
-            (os.path.join("data_treated", "allos_data.xlsx"), "B14", "SSR Allos"),
-            (os.path.join("data_treated", "allos_data.xlsx"), "B23", "OC Allos"),
-            (os.path.join("data_treated", "allos_data.xlsx"), "B25", "TXOcup Allos"),
-            (os.path.join("data_treated", "allos_data.xlsx"), "B24", "InadimplenciaLiq Allos"),
-            
-            (os.path.join("data_treated", "iguatemi_data.xlsx"), "B48", "Trimestres Iguatemi"),
-            (os.path.join("data_treated", "iguatemi_data.xlsx"), "B54", "SSS Iguatemi"),
-            (os.path.join("data_treated", "iguatemi_data.xlsx"), "B17", "SSR Iguatemi"),
-            (os.path.join("data_treated", "iguatemi_data.xlsx"), "B19", "OC Iguatemi"),
-            (os.path.join("data_treated", "iguatemi_data.xlsx"), "B20", "TXOcup Iguatemi"),
-            (os.path.join("data_treated", "iguatemi_data.xlsx"), "B21", "InadimplenciaLiq Iguatemi"),
-
-            (os.path.join("data_treated", "Multiplan_data.xlsx"), "B6", "Trimestres Multiplan"),
-            (os.path.join("data_treated", "Multiplan_data.xlsx"), "B37", "SSS Multiplan"),
-            (os.path.join("data_treated", "Multiplan_data.xlsx"), "B38", "SSR Multiplan"),
-            (os.path.join("data_treated", "Multiplan_data.xlsx"), "B39", "OC Multiplan"),
-            (os.path.join("data_treated", "Multiplan_data.xlsx"), "B43", "TXOcup Multiplan"),
-            (os.path.join("data_treated", "Multiplan_data.xlsx"), "B45", "InadimplenciaLiq Multiplan")
-            
-            
+    def get_row_refs(self):
+        """Linhas extraídas de cada empresa: (arquivo tratado, célula inicial, nome_linha)"""
+        return [
+            (os.path.join("data_treated", adaptador['tratado']), cell_ref, f"{metrica} {nome}")
+            for nome, adaptador in self.empresas.items()
+            for metrica, cell_ref in adaptador['celulas'].items()
         ]
-        
-        # Verificar se os arquivos existem
-        arquivos_faltando = []
-        for caminho, _, _ in empresas_info:
-            if not os.path.exists(caminho):
-                arquivos_faltando.append(caminho)
+
+    def consolidate_data(self, direct=False, parallel=False, inflacao=True):
+        """Consolida os dados das três empresas
+
+        Com direct=True as linhas são lidas direto dos reports originais em
+        reports/, sem depender dos arquivos intermediários de data_treated.
+        Com parallel=True cada arquivo é lido num processo separado.
+        Com inflacao=False as abas/linhas de inflação são omitidas.
+        """
+        empresas_info = self.get_row_refs()
+        # Arquivos na ordem de empresas_info, que define a ordem das linhas no consolidado
+        ordem = list(dict.fromkeys(path for path, _, _ in empresas_info))
+        fontes = sorted(self.get_files_to_process(), key=lambda info: ordem.index(info['output']))
+
+        # Verificar se os reports existem (a chave do cache de extração vem deles; os
+        # arquivos tratados só são lidos para reports que não estão no cache)
+        arquivos_faltando = [info['input'] for info in fontes if not os.path.exists(info['input'])]
         
         if arquivos_faltando:
             raise FileNotFoundError(f"Arquivos não encontrados: {', '.join(set(arquivos_faltando))}")
         
+        with self.medir('extracao'):
+            por_fonte, erros = self.extract_series(fontes, direct, parallel)
+        if erros:
+            raise RuntimeError("Falha na extração: " + "; ".join(f"{fontes[i]['name']}: {e}" for i, e in erros.items()))
+        empresa_metrica_trimestres = {}
+        for i in range(len(fontes)):
+            empresa_metrica_trimestres.update(por_fonte[i])
+
+        # Cubo empresa x métrica x trimestre, base de todas as saídas
+        with self.medir('cubo'):
+            cube = MetricCube.from_series(empresa_metrica_trimestres)
+        self.cube = cube
+        return self.write_consolidado(cube, inflacao)
+
+    def build_series(self, empresas_info, linhas_extraidas):
+        """Monta {(empresa, métrica): {Quarter: valor numérico}} a partir das linhas extraídas
+
+        Apenas as entradas de empresas_info presentes em linhas_extraidas são
+        usadas, de modo que um único report (uma empresa) também pode ser montado.
+        """
         # Separar cabeçalhos (trimestres) e métricas por empresa
         headers = []
         metricas_linhas = []
-        
         for path, cell_ref, nome_linha in empresas_info:
-            debug_print(f"Processando: {nome_linha} de {path}")
-            wb = openpyxl.load_workbook(path, data_only=True)
-            ws = wb.active
-            valores = self.get_row_values_from_cell(ws, cell_ref, nome_linha)
-            print(f"[DEBUG] Extraindo: {nome_linha} de {path} -> {valores}")  # Debug print
+            if nome_linha not in linhas_extraidas:
+                continue
+            valores = linhas_extraidas[nome_linha]
+            logger.debug("Extraindo: %s de %s -> %s", nome_linha, path, valores)
             if nome_linha.startswith("Trimestres"):
                 headers.append((nome_linha, self.padroniza_trimestres(valores[1:])))
             else:
                 metricas_linhas.append((nome_linha, valores[1:]))
 
-            print("Trimestres Iguatemi:", valores[1:])
-            print("Valores SSS Iguatemi:", valores[1:])
-
-        # Montar dicionário: (empresa, metrica) -> {trimestre: valor}
+        # Montar dicionário: (empresa, metrica) -> {trimestre: valor numérico}
         empresa_metrica_trimestres = {}
         empresa_trimestres = {}
         for (nome_header, trimestres) in headers:
@@ -355,401 +1285,548 @@ class ReportProcessor:
             else:
                 metrica = nome_linha
                 empresa = ""
-            print(f"[DEBUG] Procurando trimestres para empresa: '{empresa}' em {list(empresa_trimestres.keys())}")
-            trimestres = empresa_trimestres.get(empresa, [])
-            empresa_metrica_trimestres[(empresa, metrica)] = self.align_trimestres(trimestres, valores)
-
-        # Unir todos os trimestres possíveis, ordenados
-        todos_trimestres = []
-        for trimestres in empresa_trimestres.values():
-            todos_trimestres.extend(trimestres)
-        todos_trimestres = self.sort_trimestres(sorted(set(t for t in todos_trimestres if t not in (None, '', 'n/a', 'n.d.'))))
-
-        # Criar nova planilha consolidada
-        wb_out = openpyxl.Workbook()
-        ws_out = wb_out.active
-        ws_out.title = "Consolidado"
-        ws_out.append(["Empresa", "Métrica"] + todos_trimestres)
-        for (empresa, metrica), valores_dict in empresa_metrica_trimestres.items():
-            linha = [empresa, metrica]
-            for t in todos_trimestres:
-                val = self.to_percent_or_nan(valores_dict.get(t, ""))
-                if val is None or str(val).strip().lower() in ["nan", "nan%", "none", "nan", "nan%", "nan%", ""]:
-                    val = ''
-                linha.append(val)
-            ws_out.append(linha)
-
-        # Salvar arquivo consolidado
-        output_path = Path("data_treated") / "Consolidado.xlsx"
-        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-        wb_out.save(str(output_path))
-        debug_print(f"Arquivo consolidado salvo em: {output_path}")
-
-        # Adicionar aba IPCA/IGPM
-        ipca_igpm_csv = "ipca_igpm_20250701.csv"
-        if os.path.exists(ipca_igpm_csv):
-            self.add_ipca_igpm_sheet(str(output_path), ipca_igpm_csv)
-        else:
-            debug_print(f"Arquivo {ipca_igpm_csv} não encontrado. Aba IPCA_IGPM não adicionada.")
-
-        # Inserir inflação trimestral na segunda aba
-        self.insert_trimestral_inflation_to_second_sheet(str(output_path))
-        self.insert_sss_ssr_descontado_in_first_sheet(str(output_path))
-
-        # Gera e salva o gráfico automaticamente
-        self.plot_all_metrics_from_excel(str(output_path))
-        # Mover para área de trabalho
-        desktop = Path.home() / "Desktop"
-        dest = desktop / "Consolidado.xlsx"
-        shutil.copy2(output_path, dest)
-        debug_print(f"Arquivo consolidado copiado para: {dest}")
+            cabecalho = linhas_extraidas.get(('Trimestres', nome_linha))
+            if cabecalho is not None:
+                # Métrica num bloco com cabeçalho próprio (ver get_rows_values_by_label)
+                trimestres = self.padroniza_trimestres(cabecalho[1:])
+            else:
+                logger.debug("Procurando trimestres para empresa: '%s' em %s", empresa, list(empresa_trimestres))
+                trimestres = empresa_trimestres.get(empresa, [])
+            alinhados = self.align_trimestres(trimestres, valores)
+            empresa_metrica_trimestres[(empresa, metrica)] = {t: self.to_number_or_nan(v) for t, v in alinhados.items()}
+        return empresa_metrica_trimestres
+
+    def write_consolidado(self, cube, inflacao=True):
+        """Grava o Consolidado.xlsx (e a imagem dos gráficos) a partir do cubo; retorna o caminho final"""
+        with self.medir('planilha'):
+            # Criar nova planilha consolidada
+            wb_out = openpyxl.Workbook()
+            ws_out = wb_out.active
+            ws_out.title = "Consolidado"
+            posicoes = {}
+            self.write_cube_rows(ws_out, cube, header=True, posicoes=posicoes)
+
+        # Montar as demais abas em memória; o arquivo é gravado uma única vez
+        if inflacao:
+            # Só consulta o BCB se ninguém tentou antes (ex.: consolidate_data ou backfill chamados direto)
+            if not self.inflacao_consultada:
+                with self.medir('inflacao'):
+                    self.update_inflation()
+            with self.medir('abas_inflacao'):
+                if self.inflacao_mensal is not None:
+                    self.add_ipca_igpm_sheet(wb_out)
+                else:
+                    debug_print("Dados de inflação indisponíveis. Aba IPCA_IGPM não adicionada.")
+
+                # Inserir inflação trimestral na segunda aba
+                self.insert_trimestral_inflation_to_second_sheet(wb_out)
+            with self.medir('deflacao'):
+                self.insert_sss_ssr_descontado_in_first_sheet(wb_out, cube, posicoes)
+
+        # Gráficos nativos do Excel, gravados junto com o consolidado
+        if self.opcoes_grafico['excel']:
+            with self.medir('graficos_excel'):
+                self.add_excel_charts(wb_out, cube, posicoes)
+
+        # Salvar arquivo consolidado num temporário exclusivo desta execução, na pasta de
+        # destino (área de trabalho por padrão): execuções simultâneas não dividem arquivo
+        dest = Path(self.destino) / "Consolidado.xlsx"
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=dest.parent, prefix='.Consolidado_', suffix='.xlsx', delete=False) as tmp:
+            tmp_path = Path(tmp.name)
+        try:
+            with self.medir('gravacao'):
+                wb_out.save(str(tmp_path))
+                debug_print(f"Arquivo consolidado salvo em: {tmp_path}")
+
+            # Gera e salva a imagem dos gráficos, a partir do cubo em memória
+            if self.opcoes_grafico['png']:
+                with self.medir('grafico_png'):
+                    self.plot_all_metrics(cube, self.pasta_graficos / 'graficos_consolidado.png')
+            # Troca atômica: o destino nunca fica com um consolidado incompleto ou de outra execução
+            with self.medir('copia'):
+                os.replace(tmp_path, dest)
+                if self.copia_data_treated:
+                    Path("data_treated").mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(dest, Path("data_treated") / "Consolidado.xlsx")
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        debug_print(f"Arquivo consolidado gravado em: {dest}")
         return str(dest)
 
+    def find_report_sets(self, pasta):
+        """Localiza (recursivamente) os reports de vários trimestres em pasta
+
+        Retorna as entradas de get_files_to_process de cada arquivo, com
+        'input' apontando para ele e 'trimestre' (Quarter da divulgação),
+        ordenadas da divulgação mais antiga para a mais recente. Quando mais
+        de um arquivo traz a mesma empresa e trimestre de divulgação (ex.: a
+        mesma planilha em duas subpastas, ou 1T25 e 1Q25), vale o modificado
+        por último; os demais são ignorados com um aviso no log.
+        """
+        modelos = {info['name'].lower(): info for info in self.get_files_to_process()}
+        por_divulgacao = {}
+        for caminho in sorted(Path(pasta).rglob('*.xlsx')):
+            match = PADRAO_REPORT.match(caminho.name)
+            if not match or caminho.name.startswith('~$'):
+                continue
+            modelo = modelos.get(match.group('empresa').strip().lower())
+            trimestre = Quarter.parse(match.group('trimestre'))
+            if modelo is None or trimestre is None:
+                debug_print(f"Ignorando arquivo fora do padrão: {caminho}")
+                continue
+            por_divulgacao.setdefault((modelo['name'], trimestre), []).append(caminho)
+        relatorios = []
+        for (nome, trimestre), caminhos in por_divulgacao.items():
+            # Mais recente por último; empate na data decidido pelo caminho
+            caminhos.sort(key=lambda caminho: (caminho.stat().st_mtime_ns, str(caminho)))
+            for ignorado in caminhos[:-1]:
+                logger.warning("%s %s: %s ignorado; vale %s, modificado por último",
+                               nome, trimestre, ignorado, caminhos[-1])
+            relatorios.append({**modelos[nome.lower()], 'input': str(caminhos[-1]), 'trimestre': trimestre})
+        relatorios.sort(key=lambda r: (r['trimestre'], r['name']))
+        return relatorios
+
+    def extract_report_series(self, fonte, direct=True):
+        """Extrai as séries de um único report (uma empresa, um trimestre de divulgação)
+
+        Com direct=False lê o arquivo tratado (fonte['output']) em vez do report original.
+        """
+        empresas_info = [info for info in self.get_row_refs() if info[0] == fonte['output']]
+        refs = [(cell_ref, nome_linha) for _, cell_ref, nome_linha in empresas_info]
+        linhas = self.extract_file_rows(fonte['output'], refs, fonte if direct else None)
+        return self.build_series(empresas_info, linhas)
+
+    def extraction_key(self, fonte):
+        refs = [(cell_ref, nome_linha) for path, cell_ref, nome_linha in self.get_row_refs() if path == fonte['output']]
+        rotulos = sorted(self.rotulos.get(fonte['name'], {}).items())
+        return self.cache_extracao.key(fonte, (refs, rotulos))
+
+    def cached_series(self, fonte):
+        """Séries do report vindas do cache de extração; None se não houver (ou cache desativado)"""
+        if self.cache_extracao is None:
+            return None
+        return self.cache_extracao.load(self.extraction_key(fonte))
+
+    def report_name(self, fonte):
+        """Nome do report para mensagens: empresa, mais o trimestre de divulgação no backfill"""
+        return fonte['name'] if 'trimestre' not in fonte else f"{fonte['name']} {fonte['trimestre']}"
+
+    def extract_series(self, fontes, direct=True, parallel=False, on_done=None):
+        """Séries de cada report em fontes, pelo índice do report em fontes
+
+        Reports idênticos a execuções anteriores vêm do cache de extração, sem
+        abrir a planilha; os demais são lidos (num pool de processos com
+        parallel=True) e gravados no cache, cada um sob a chave do próprio
+        arquivo. Retorna (séries, erros), ambos por índice; on_done recebe o
+        nome do report (ver report_name).
+        """
+        series = {}
+        tasks = []
+        for i, fonte in enumerate(fontes):
+            cache = self.cached_series(fonte)
+            if cache is not None:
+                debug_print(f"{self.report_name(fonte)}: report sem alterações, séries lidas do cache")
+                series[i] = cache
+            else:
+                tasks.append((i, self.extract_report_series, (fonte, direct)))
+        avisar = None
+        if on_done:
+            avisar = lambda i, concluidas, total: on_done(self.report_name(fontes[i]), concluidas, total)
+        resultados, erros = self.run_company_tasks(tasks, parallel, avisar)
+        for i, resultado in resultados.items():
+            series[i] = resultado
+            if self.cache_extracao is not None:
+                self.cache_extracao.store(self.extraction_key(fontes[i]), resultado, fontes[i])
+        return series, erros
+
+    def backfill(self, pasta, parallel=True, status_callback=None, inflacao=True, progress_callback=None):
+        """Reconstrói o histórico consolidado a partir dos reports de vários trimestres
+
+        Cada report de pasta (ver find_report_sets) é lido num pool de
+        processos, exceto os que já estão no cache de extração. Trimestres
+        presentes em mais de um report ficam com o valor da divulgação mais
+        recente; células vazias não apagam valores de divulgações anteriores. Reports com erro são registrados no log e
+        ignorados. progress_callback recebe o progresso (0-100), como em
+        process_files; um cancelamento levanta ProcessamentoCancelado.
+        Retorna o caminho final do Consolidado.xlsx.
+        """
+        self.iniciar_medicao()
+        etapas = self.etapas_consolidacao(inflacao)
+        if inflacao and not self.inflacao_consultada:
+            # write_consolidado baixa a inflação logo antes das abas que dependem dela
+            etapas.insert(etapas.index('abas_inflacao'), 'inflacao')
+        self.planejar_progresso(etapas, progress_callback)
+        sucesso = False
+        try:
+            relatorios = self.find_report_sets(pasta)
+            if not relatorios:
+                raise FileNotFoundError(f"Nenhum report encontrado em {pasta}")
+            if status_callback:
+                status_callback(f"{len(relatorios)} reports encontrados em {pasta}")
+
+            def on_done(nome, concluidas, total):
+                if status_callback:
+                    status_callback(f"{nome} lido ({concluidas}/{total})")
+
+            with self.medir('extracao'):
+                resultados, erros = self.extract_series(relatorios, parallel=parallel, on_done=on_done)
+            for i, erro in erros.items():
+                nome = self.report_name(relatorios[i])
+                debug_print(f"Erro ao ler {nome}: {erro}")
+                if status_callback:
+                    status_callback(f"Erro ao ler {nome}: {erro}")
+            if not resultados:
+                raise RuntimeError("Nenhum report pôde ser lido")
+
+            # Divulgações em ordem cronológica: a mais recente sobrescreve as anteriores
+            historico = {}
+            for i in range(len(relatorios)):
+                for chave, serie in resultados.get(i, {}).items():
+                    destino = historico.setdefault(chave, {})
+                    for trimestre, valor in serie.items():
+                        if not np.isnan(valor) or trimestre not in destino:
+                            destino[trimestre] = valor
+
+            with self.medir('cubo'):
+                cube = MetricCube.from_series(historico)
+            self.cube = cube
+            caminho = self.write_consolidado(cube, inflacao)
+            sucesso = True
+            return caminho
+        finally:
+            self.progress_callback = None
+            self.finalizar_medicao(sucesso, modo='backfill', pasta=str(pasta), parallel=parallel, inflacao=inflacao)
+
     def to_number_or_nan(self, val):
+        """Converte para float (aceita vírgula decimal); NaN se vazio ou inválido"""
+        if isinstance(val, (int, float)) and not isinstance(val, bool):
+            return float(val) if np.isfinite(val) else np.nan
         try:
-            # Tenta converter para float (aceita int também)
-            return float(str(val).replace(',', '.'))
+            num = float(str(val).replace(',', '.'))
         except (ValueError, TypeError):
-            return "NaN"
-
-    def add_ipca_igpm_sheet(self, excel_path, csv_path=None):
-        """Adiciona uma nova aba com os dados de IPCA/IGPM ao arquivo Excel consolidado."""
-        import openpyxl
-        import csv
-        import glob
-        import os
-        wb = openpyxl.load_workbook(excel_path)
+            return np.nan
+        return num if np.isfinite(num) else np.nan
+
+    def apply_number_format(self, ws, formato, min_row=1, min_col=1, max_row=None, max_col=None):
+        """Aplica o formato numérico do Excel às células numéricas do intervalo"""
+        for row in ws.iter_rows(min_row=min_row, min_col=min_col, max_row=max_row, max_col=max_col):
+            for cell in row:
+                if isinstance(cell.value, (int, float)):
+                    cell.number_format = formato
+
+    def write_cube_rows(self, ws, cube, metricas=None, header=False, start_row=1, posicoes=None):
+        """Escreve as linhas (Empresa, Métrica, valores em %) do cubo a partir de start_row
+
+        NaN vira célula vazia. Se posicoes for um dict, registra nele a linha
+        de cada (empresa, métrica). Retorna a próxima linha livre.
+        """
+        row_idx = start_row
+        if header:
+            for col_idx, value in enumerate(["Empresa", "Métrica"] + [str(q) for q in cube.quarters], 1):
+                ws.cell(row=row_idx, column=col_idx, value=value)
+            row_idx += 1
+        for empresa, metrica, valores in cube.rows(metricas):
+            ws.cell(row=row_idx, column=1, value=empresa)
+            ws.cell(row=row_idx, column=2, value=metrica)
+            if posicoes is not None:
+                posicoes[(empresa, metrica)] = row_idx
+            for col_idx, value in enumerate(valores.tolist(), 3):
+                if not np.isnan(value):
+                    ws.cell(row=row_idx, column=col_idx, value=value).number_format = FORMATO_PERCENTUAL
+            row_idx += 1
+        return row_idx
+
+    def inflation_quarterly_rows(self):
+        """Inflação trimestral (%) como linhas: cabeçalho + [1Q25, 2.32, ...] (None se faltar)"""
+        trimestral = self.inflacao_trimestral
+        labels = inflation.format_trimestre_labels(trimestral.index)
+        rows = [['trimestre'] + list(trimestral.columns)]
+        for label, linha in zip(labels, trimestral.values.tolist()):
+            rows.append([label] + [None if pd.isna(v) else v for v in linha])
+        return rows
+
+    def add_ipca_igpm_sheet(self, wb):
+        """Adiciona uma nova aba com os dados de IPCA/IGPM ao workbook consolidado (em memória)."""
         # Remove a aba se já existir para evitar duplicidade
         if 'IPCA_IGPM' in wb.sheetnames:
             std = wb['IPCA_IGPM']
             wb.remove(std)
         ws = wb.create_sheet('IPCA_IGPM')
-        # Buscar o CSV mensal mais recente
-        csv_files = glob.glob('ipca_igpm_*.csv')
-        csv_files = [f for f in csv_files if 'trimestre' not in f]
-        if csv_files:
-            csv_files.sort(reverse=True)
-            csv_path = csv_files[0]
-        else:
-            ws.append(['Nenhum arquivo ipca_igpm_*.csv encontrado'])
-            wb.save(excel_path)
-            debug_print(f"Aba IPCA_IGPM adicionada ao arquivo: {excel_path}")
-            return
-        # Adiciona dados mensais, trocando ponto por vírgula nos valores
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                new_row = []
-                for i, value in enumerate(row):
-                    if i > 0 and value:
-                        value = value.replace('.', ',')
-                    new_row.append(value)
-                ws.append(new_row)
+        # Adiciona dados mensais (%)
+        mensal = self.inflacao_mensal
+        colunas = [c for c in mensal.columns if c != 'data']
+        ws.append(['data'] + colunas)
+        datas = mensal['data'].dt.strftime('%d/%m/%Y').tolist()
+        valores = mensal[colunas].values.tolist()
+        for data, linha in zip(datas, valores):
+            ws.append([data] + [None if pd.isna(v) else v for v in linha])
         # Adiciona linha em branco
         ws.append([])
-        # Adiciona dados trimestrais, se existir o arquivo
-        trimestral_csv = 'ipca_igpm_trimestres.csv'
-        if os.path.exists(trimestral_csv):
-            with open(trimestral_csv, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    ws.append(row)
-        else:
-            ws.append(['Arquivo ipca_igpm_trimestres.csv não encontrado'])
-        wb.save(excel_path)
-        debug_print(f"Aba IPCA_IGPM adicionada ao arquivo: {excel_path}")
-
-    def insert_trimestral_inflation_to_second_sheet(self, excel_path):
-        import openpyxl
-        import csv
-        wb = openpyxl.load_workbook(excel_path)
+        # Adiciona dados trimestrais
+        for row in self.inflation_quarterly_rows():
+            ws.append(row)
+        self.apply_number_format(ws, FORMATO_INFLACAO, min_col=2)
+        debug_print("Aba IPCA_IGPM adicionada ao consolidado")
+
+    def insert_trimestral_inflation_to_second_sheet(self, wb):
         # Segunda aba
         if len(wb.sheetnames) < 2:
             debug_print('Menos de duas abas no consolidado, não foi possível inserir inflação trimestral.')
             return
         ws = wb.worksheets[1]
-        # Ler dados trimestrais
-        trimestral_csv = 'ipca_igpm_trimestres.csv'
-        if not os.path.exists(trimestral_csv):
-            debug_print('Arquivo ipca_igpm_trimestres.csv não encontrado para inserir na segunda aba.')
+        if self.inflacao_trimestral is None:
+            debug_print('Inflação trimestral indisponível para inserir na segunda aba.')
             return
-        with open(trimestral_csv, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            rows = list(reader)
+        rows = self.inflation_quarterly_rows()
         # Inserir cabeçalho na coluna E (índice 5)
         for i, row in enumerate(rows):
             for j, value in enumerate(row):
-                # Se for valor numérico, garantir vírgula como separador decimal
-                if j > 0 and value:
-                    value = value.replace('.', ',')
-                ws.cell(row=i+1, column=5+j, value=value)
-        wb.save(excel_path)
+                cell = ws.cell(row=i+1, column=5+j, value=value)
+                if isinstance(value, float):
+                    cell.number_format = FORMATO_INFLACAO
         debug_print('Inflação trimestral inserida na coluna E da segunda aba.')
 
-    def insert_sss_ssr_descontado_in_first_sheet(self, excel_path):
-        import openpyxl
-        import csv
-        import os
-        wb = openpyxl.load_workbook(excel_path)
+    def deflate(self, valores, inflacao):
+        """Desconta a inflação: (1+v)/(1+i)-1
+
+        valores é uma matriz empresa x trimestre e inflacao o vetor alinhado às
+        colunas, ambos em fração (0,05 = 5%); NaN em qualquer um dos dois
+        resulta em NaN.
+        """
+        valores = np.asarray(valores, dtype=float)
+        inflacao = np.asarray(inflacao, dtype=float)
+        return (1 + valores) / (1 + inflacao) - 1
+
+    def inflation_vector(self, indice, trimestres):
+        """Inflação trimestral do índice, em fração, alinhada à lista de trimestres (NaN onde faltar)"""
+        serie = self.inflacao_trimestral[indice]
+        # Mesmo índice inteiro de Quarter (ano*4 + trimestre) a partir do PeriodIndex
+        indices = serie.index.year * 4 + serie.index.quarter
+        serie = pd.Series(serie.values / 100, index=indices)
+        alvo = [q.index if q is not None else -1 for q in map(Quarter.parse, trimestres)]
+        return serie.reindex(alvo).values
+
+    def deflate_cube(self, cube):
+        """Acrescenta ao cubo as métricas descontadas pela inflação (ver self.deflatores)
+
+        Retorna a lista das métricas criadas (ex.: ['SSS_Descontado', 'SSR_Descontado']).
+        """
+        criadas = []
+        if self.inflacao_trimestral is None:
+            return criadas
+        quarters = cube.quarters
+        for metrica, indice in self.deflatores.items():
+            if metrica not in cube.metricas:
+                continue
+            if indice not in self.inflacao_trimestral.columns:
+                debug_print(f"Índice {indice} indisponível para descontar {metrica}.")
+                continue
+            j = cube.metricas.index(metrica)
+            descontado = self.deflate(cube.get(metrica=metrica), self.inflation_vector(indice, quarters))
+            cube.add_metric(f'{metrica}_Descontado', descontado, present=cube.present[:, j])
+            criadas.append(f'{metrica}_Descontado')
+        return criadas
+
+    def insert_sss_ssr_descontado_in_first_sheet(self, wb, cube, posicoes=None):
+        """Insere as métricas descontadas pela inflação abaixo das linhas do consolidado
+
+        Fica uma linha em branco entre os blocos (com as três empresas
+        originais o bloco começa em A18).
+        """
         ws = wb.worksheets[0]
-        # Ler cabeçalho e trimestres
-        header = [cell.value for cell in ws[1]]
-        trimestres = header[2:]
-        # Ler inflação trimestral
-        trimestral_csv = 'ipca_igpm_trimestres.csv'
-        if not os.path.exists(trimestral_csv):
-            debug_print('Arquivo ipca_igpm_trimestres.csv não encontrado para inserir SSS/SSR descontado.')
+        if self.inflacao_trimestral is None:
+            debug_print('Inflação trimestral indisponível para inserir SSS/SSR descontado.')
             return
-        with open(trimestral_csv, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            inflacao = {row['trimestre'].replace('T','Q'): {'IPCA': row['IPCA'].replace(',', '.') if row['IPCA'] else None,
-                                                            'IGPM': row['IGPM'].replace(',', '.') if row['IGPM'] else None}
-                        for row in reader}
-        # Coletar linhas SSS e SSR
-        sss_rows = []
-        ssr_rows = []
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            empresa, metrica, *valores = row
-            if metrica == 'SSS':
-                sss_rows.append((empresa, valores))
-            elif metrica == 'SSR':
-                ssr_rows.append((empresa, valores))
-        # Calcular linhas descontadas
-        new_rows = []
-        for empresa, valores in sss_rows:
-            new_row = [empresa, 'SSS_Descontado']
-            for i, t in enumerate(trimestres):
-                t_pad = str(t).replace('T', 'Q')
-                val = valores[i]
-                if val is None or str(val).strip().lower() in ['nan', 'nan%','none','nan','nan%','nan%']:
-                    new_row.append('')
-                    continue
-                try:
-                    val_f = float(str(val).replace(',', '.').replace('%',''))
-                except:
-                    new_row.append('')
-                    continue
-                fator = inflacao.get(t_pad, {}).get('IPCA')
-                if fator is None or fator == '' or fator == 'nan':
-                    new_row.append('')
-                    continue
-                try:
-                    fator_f = float(fator)
-                except:
-                    new_row.append('')
-                    continue
-                try:
-                    descontado = (1+val_f/100)/(1+fator_f/100)-1
-                    descontado = descontado*100
-                    descontado_str = f"{descontado:.2f}".replace('.', ',') + '%'
-                    if descontado_str.lower() in ['nan%', 'nan', 'none', 'nan%']:
-                        descontado_str = ''
-                    new_row.append(descontado_str)
-                except:
-                    new_row.append('')
-            new_rows.append(new_row)
-        for empresa, valores in ssr_rows:
-            new_row = [empresa, 'SSR_Descontado']
-            for i, t in enumerate(trimestres):
-                t_pad = str(t).replace('T', 'Q')
-                val = valores[i]
-                if val is None or str(val).strip().lower() in ['nan', 'nan%','none','nan','nan%','nan%']:
-                    new_row.append('')
-                    continue
-                try:
-                    val_f = float(str(val).replace(',', '.').replace('%',''))
-                except:
-                    new_row.append('')
-                    continue
-                fator = inflacao.get(t_pad, {}).get('IGPM')
-                if fator is None or fator == '' or fator == 'nan':
-                    new_row.append('')
-                    continue
-                try:
-                    fator_f = float(fator)
-                except:
-                    new_row.append('')
-                    continue
-                try:
-                    descontado = (1+val_f/100)/(1+fator_f/100)-1
-                    descontado = descontado*100
-                    descontado_str = f"{descontado:.2f}".replace('.', ',') + '%'
-                    if descontado_str.lower() in ['nan%', 'nan', 'none', 'nan%']:
-                        descontado_str = ''
-                    new_row.append(descontado_str)
-                except:
-                    new_row.append('')
-            new_rows.append(new_row)
-        # Inserir a partir da linha 18 (A18)
-        for idx, row in enumerate(new_rows):
-            for col_idx, value in enumerate(row, 1):
-                if value is None or str(value).strip().lower() in ['nan', 'nan%','none','nan','nan%','nan%']:
-                    value = ''
-                ws.cell(row=18+idx, column=col_idx, value=value)
-        wb.save(excel_path)
-        debug_print('SSS e SSR descontados inseridos na primeira aba a partir de A18.')
+        # Inserir após uma linha em branco, uma métrica de cada vez
+        row_idx = ws.max_row + 2
+        inicio = row_idx
+        for metrica in self.deflate_cube(cube):
+            row_idx = self.write_cube_rows(ws, cube, [metrica], start_row=row_idx, posicoes=posicoes)
+        debug_print(f'Métricas descontadas inseridas na primeira aba a partir de A{inicio}.')
 
-    def plot_all_metrics_from_excel(self, excel_path, output_path='graficos_consolidado.png'):
-        import matplotlib.pyplot as plt
-        import pandas as pd
-        import numpy as np
-        import os
-        import sys
+    def add_excel_charts(self, wb, cube, posicoes, metricas=GRAFICOS_EXCEL):
+        """Cria a aba Graficos com gráficos de linha nativos do Excel
+
+        Um gráfico por métrica e por sua versão _Descontado, com as séries
+        apontando para as linhas da primeira aba (posicoes: (empresa, métrica)
+        -> linha), de modo que os gráficos acompanham edições na planilha.
+        """
+        ws_dados = wb.worksheets[0]
+        n_trimestres = len(cube.quarters)
+        if not n_trimestres:
+            return
+        ws = wb.create_sheet("Graficos")
+        categorias = Reference(ws_dados, min_col=3, max_col=2 + n_trimestres, min_row=1)
+        graficos = []
+        for metrica in metricas:
+            graficos.extend(m for m in (metrica, f'{metrica}_Descontado') if m in cube.metricas)
+        adicionados = 0
+        for metrica in graficos:
+            linhas = [(empresa, posicoes[(empresa, metrica)]) for empresa in cube.empresas
+                      if (empresa, metrica) in posicoes]
+            if not linhas:
+                continue
+            chart = LineChart()
+            chart.title = metrica
+            chart.x_axis.title = 'Trimestre'
+            chart.y_axis.title = '%'
+            chart.y_axis.number_format = '0%'
+            # openpyxl 3.1 marca os eixos como ocultos por padrão
+            chart.x_axis.delete = False
+            chart.y_axis.delete = False
+            chart.width, chart.height = 24, 10
+            for empresa, linha in linhas:
+                valores = Reference(ws_dados, min_col=3, max_col=2 + n_trimestres, min_row=linha)
+                serie = Series(valores, title=str(empresa))
+                # Rótulos dos trimestres são texto (1Q25): referência de strings
+                serie.cat = AxDataSource(strRef=StrRef(f=str(categorias)))
+                chart.series.append(serie)
+            # Duas colunas de gráficos, 21 linhas por gráfico
+            ancora = f"{'A' if adicionados % 2 == 0 else 'O'}{1 + (adicionados // 2) * 21}"
+            ws.add_chart(chart, ancora)
+            adicionados += 1
+        debug_print(f"{adicionados} gráficos nativos adicionados à aba Graficos.")
 
+    def plot_all_metrics_from_excel(self, excel_path, output_path='graficos_consolidado.png'):
+        """Gera os gráficos a partir de um Consolidado.xlsx já gravado"""
         # Lê a primeira aba do consolidado
         df = pd.read_excel(excel_path, sheet_name=0)
-        metricas = ['SSS', 'SSR', 'OC', 'TXOcup', 'InadimplenciaLiq']
-        metricas_existentes = df['Métrica'].unique()
-        metricas_para_plotar = [m for m in metricas if m in metricas_existentes]
-        if not metricas_para_plotar:
-            return
+        self.plot_all_metrics(MetricCube.from_frame(df), output_path)
 
-        trimestres_todos = df.columns[2:].tolist()
-        trimestres_filtrados = []
-        for trimestre in trimestres_todos:
-            if isinstance(trimestre, str) and 'Q' in trimestre:
-                ano_str = trimestre.split('Q')[-1]
-                try:
-                    ano = int(ano_str)
-                    if ano >= 20:
-                        trimestres_filtrados.append(trimestre)
-                except:
-                    continue
+    def build_plot_panels(self, cube, metricas=('SSS', 'SSR', 'OC', 'TXOcup', 'InadimplenciaLiq'), inicio=Quarter(2020, 1)):
+        """Monta os painéis do gráfico (um por métrica) como arrays, a partir de `inicio`"""
+        # 2020 em diante: fatia direta do eixo de trimestres do cubo
+        janela = cube.quarter_slice(inicio=inicio)
+        quarters = cube.quarters[janela]
+        if not quarters:
+            return []
+        labels = [str(q) for q in quarters]
+        # Mostrar apenas 1Q de cada ano no eixo X
+        xticks = [j for j, q in enumerate(quarters) if q.q == 1]
+        paineis = []
+        for metrica in metricas:
+            if metrica not in cube.metricas:
+                continue
+            linhas = list(cube.rows([metrica]))
+            empresas = [str(empresa) for empresa, _, _ in linhas]
+            # Valores em fração no consolidado; o gráfico é em %
+            valores = np.array([serie[janela] for _, _, serie in linhas]).reshape(len(linhas), len(quarters)) * 100
+            paineis.append({'metrica': metrica, 'empresas': empresas, 'valores': valores,
+                            'labels': labels, 'xticks': xticks})
+        return paineis
 
-        if not trimestres_filtrados:
-            return
+    def plot_all_metrics(self, cube, output_path='graficos_consolidado.png', **opcoes):
+        """Gera os gráficos a partir do cubo consolidado (MetricCube)
+
+        opcoes sobrepõe self.opcoes_grafico: dpi, formato ('png', 'svg', ...;
+        None usa a extensão de output_path), abrir (abre a imagem ao final),
+        por_metrica (um arquivo por métrica), parallel (com por_metrica,
+        desenha os arquivos em processos separados) e cache (reaproveita de
+        chart_cache/ as imagens cujos dados e estilo não mudaram). Retorna os
+        arquivos gerados.
+        """
+        opcoes = {**self.opcoes_grafico, **opcoes}
+        paineis = self.build_plot_panels(cube)
+        if not paineis:
+            return []
+        output_path = Path(output_path)
+        if opcoes['formato']:
+            output_path = output_path.with_suffix(f".{opcoes['formato']}")
+        output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        n_metricas = len(metricas_para_plotar)
-        n_cols = min(3, n_metricas)
-        n_rows = (n_metricas + n_cols - 1) // n_cols
-        fig, axes = plt.subplots(n_rows, n_cols, figsize=(15, 5*n_rows))
-        fig.suptitle('Métricas Consolidadas - 2020 em diante', fontsize=16, fontweight='bold')
-        if n_metricas == 1:
-            axes = [axes]
-        elif n_rows == 1:
-            axes = [axes] if n_cols == 1 else axes
+        # Um arquivo por métrica ou uma figura única com todos os painéis
+        if opcoes['por_metrica']:
+            jobs = [(painel['metrica'], [painel],
+                     output_path.with_name(f"{output_path.stem}_{painel['metrica']}{output_path.suffix}"), None)
+                    for painel in paineis]
         else:
-            axes = axes.flatten()
-        cores = ['#1f77b4', '#ff7f0e', '#2ca02c']
-
-        # Encontrar índices dos 1Q de cada ano para os ticks
-        xticks = []
-        xticklabels = []
-        anos_vistos = set()
-        for j, trimestre in enumerate(trimestres_filtrados):
-            if isinstance(trimestre, str) and trimestre.startswith('1Q'):
-                ano_str = trimestre.split('Q')[-1]
-                try:
-                    ano = int(ano_str)
-                    if ano not in anos_vistos:
-                        xticks.append(j)
-                        xticklabels.append(trimestre)
-                        anos_vistos.add(ano)
-                except:
-                    continue
+            jobs = [('consolidado', paineis, output_path, 'Métricas Consolidadas - 2020 em diante')]
 
-        for idx, metrica in enumerate(metricas_para_plotar):
-            if idx >= len(axes):
-                break
-            ax = axes[idx]
-            dados_metrica = df[df['Métrica'] == metrica]
-            if not dados_metrica.empty:
-                for i, (_, row) in enumerate(dados_metrica.iterrows()):
-                    empresa = str(row['Empresa'])
-                    valores = []
-                    for trimestre in trimestres_filtrados:
-                        valor = row[trimestre]
-                        if pd.isna(valor) or valor == '' or str(valor).lower() in ['nan', 'nan%']:
-                            valores.append(np.nan)
-                        else:
-                            try:
-                                valor_str = str(valor).replace('%', '').replace(',', '.')
-                                valores.append(float(valor_str))
-                            except:
-                                valores.append(np.nan)
-                    print(f"Plotando {metrica} - {empresa}: {valores}")  # DEBUG
-                    ax.plot(trimestres_filtrados, valores, linewidth=1.0, label=empresa, color=cores[i % len(cores)], marker=None)
-            ax.set_title(f'{metrica}', fontweight='bold', fontsize=12)
-            ax.set_xlabel('Trimestre')
-            ax.set_ylabel('%')
-            ax.legend()
-            ax.grid(True, alpha=0.3)
-            # Mostrar apenas 1Q de cada ano no eixo X
-            ax.set_xticks([trimestres_filtrados[i] for i in xticks])
-            ax.set_xticklabels(xticklabels, rotation=45)
-            ax.autoscale_view()
-        for idx in range(len(metricas_para_plotar), len(axes)):
-            fig.delaxes(axes[idx])
-        plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        print(f"Gráfico salvo em: {output_path}")
+        # Reaproveitar do cache as imagens cujos dados e estilo não mudaram
+        cache = ChartCache(os.path.join(self.script_dir, 'chart_cache')) if opcoes['cache'] else None
+        arquivos = {}
+        chaves = {}
+        tasks = []
+        for nome, paineis_job, destino, titulo in jobs:
+            if cache:
+                chaves[nome] = cache.fingerprint(paineis_job, dpi=opcoes['dpi'], formato=destino.suffix, titulo=titulo)
+                if cache.fetch(chaves[nome], destino):
+                    logger.debug("Gráfico %s sem alterações, reaproveitado do cache", nome)
+                    arquivos[nome] = str(destino)
+                    continue
+            tasks.append((nome, render_metric_figure, (paineis_job, str(destino), opcoes['dpi'], titulo)))
+        resultados, erros = self.run_company_tasks(tasks, parallel=opcoes['parallel'] and opcoes['por_metrica'])
+        for nome, erro in erros.items():
+            debug_print(f"Erro ao gerar gráfico de {nome}: {erro}")
+        for nome, arquivo in resultados.items():
+            arquivos[nome] = arquivo
+            if cache:
+                cache.store(chaves[nome], arquivo)
+        if cache and resultados:
+            cache.evict()
+        arquivos = [arquivos[nome] for nome, _, _, _ in jobs if nome in arquivos]
+        for arquivo in arquivos:
+            logger.info("Gráfico salvo em: %s", arquivo)
         # Abrir a imagem automaticamente
-        try:
-            if sys.platform.startswith('win'):
-                os.startfile(output_path)
-            elif sys.platform.startswith('darwin'):
-                import subprocess
-                subprocess.run(['open', output_path])
-            else:
-                import subprocess
-                subprocess.run(['xdg-open', output_path])
-            print(f"Imagem aberta: {output_path}")
-        except Exception as e:
-            print(f"Erro ao abrir imagem: {e}")
-
-def run_processing(progress, status_label, root):
-    """Executa o processamento em thread separada"""
-    try:
-        processor = ReportProcessor()
-        
-        def progress_callback(value):
-            progress["value"] = value
-            root.update_idletasks()
-        
-        def status_callback(message):
-            status_label.config(text=message)
-            root.update_idletasks()
-        
-        success = processor.process_files(progress_callback, status_callback)
-        
-        if success:
-            # Abrir arquivo Excel
-            desktop_path = Path.home() / "Desktop"
-            consolidado_path = desktop_path / "Consolidado.xlsx"
-            
-            if consolidado_path.exists():
+        if opcoes['abrir']:
+            for arquivo in arquivos:
                 try:
-                    if sys.platform.startswith('win'):
-                        os.startfile(str(consolidado_path))
-                    elif sys.platform.startswith('darwin'):
-                        import subprocess
-                        subprocess.run(['open', str(consolidado_path)])
-                    else:
-                        import subprocess
-                        subprocess.run(['xdg-open', str(consolidado_path)])
-                    
-                    messagebox.showinfo("Sucesso", 
-                        f"Processamento concluído!\nArquivo salvo em:\n{consolidado_path}\nO arquivo foi aberto automaticamente.")
+                    open_file(arquivo)
+                    logger.info("Imagem aberta: %s", arquivo)
                 except Exception as e:
-                    debug_print(f"Erro ao abrir arquivo: {e}")
-                    messagebox.showinfo("Sucesso", 
-                        f"Processamento concluído!\nArquivo salvo em:\n{consolidado_path}\nAbra o arquivo manualmente.")
-            else:
-                messagebox.showwarning("Aviso", f"Arquivo não encontrado: {consolidado_path}")
+                    logger.warning("Erro ao abrir imagem: %s", e)
+        return arquivos
+
+def run_processing(processor, eventos):
+    """Executa o processamento em thread separada
+
+    A thread não acessa os widgets do Tk: progresso, status e o resultado
+    final vão como eventos (tipo, valor) para a fila `eventos`, consumida na
+    thread da interface (ver drenar_eventos em main). Os eventos finais são
+    'concluido' (caminho do consolidado), 'cancelado' e 'erro' (mensagem).
+    """
+    try:
+        success = processor.process_files(lambda valor: eventos.put(('progresso', valor)),
+                                          lambda mensagem: eventos.put(('status', mensagem)))
+        if processor.cancelamento.is_set():
+            eventos.put(('cancelado', None))
+        elif success:
+            eventos.put(('concluido', Path(processor.destino) / "Consolidado.xlsx"))
         else:
-            messagebox.showerror("Erro", "Falha no processamento. Verifique os logs.")
-            
+            eventos.put(('erro', "Falha no processamento. Verifique os logs."))
     except Exception as e:
         debug_print(f"ERRO CRÍTICO na interface: {e}")
         debug_print(f"Traceback: {traceback.format_exc()}")
-        logging.error("Erro crítico na interface", exc_info=True)
-        # ... resto do código
+        logger.error("Erro crítico na interface", exc_info=True)
+        eventos.put(('erro', f"Erro crítico: {e}"))
     finally:
         debug_print("=== PROCESSAMENTO FINALIZADO ===")
 
+def show_result(evento, valor):
+    """Mostra o resultado do processamento (na thread da interface)"""
+    from tkinter import messagebox
+    if evento == 'cancelado':
+        messagebox.showinfo("Cancelado", "Processamento cancelado. Nenhum consolidado foi gravado.")
+    elif evento == 'erro':
+        messagebox.showerror("Erro", valor)
+    elif not valor.exists():
+        messagebox.showwarning("Aviso", f"Arquivo não encontrado: {valor}")
+    else:
+        # Abrir arquivo Excel
+        try:
+            open_file(valor)
+            messagebox.showinfo("Sucesso",
+                f"Processamento concluído!\nArquivo salvo em:\n{valor}\nO arquivo foi aberto automaticamente.")
+        except Exception as e:
+            debug_print(f"Erro ao abrir arquivo: {e}")
+            messagebox.showinfo("Sucesso",
+                f"Processamento concluído!\nArquivo salvo em:\n{valor}\nAbra o arquivo manualmente.")
+
 def select_and_copy_files(root, status_callback):
     """Permite ao usuário selecionar os 3 arquivos Excel"""
+    from tkinter import filedialog, messagebox
     reports_dir = Path("reports")
     
     try:
@@ -759,14 +1836,11 @@ def select_and_copy_files(root, status_callback):
         messagebox.showerror("Erro", f"Erro ao criar pasta reports: {e}")
         return False
 
-    file_mappings = [
-        ("Selecione o arquivo da ALLOS", "Allos Planilha 1T25.xlsx"),
-        ("Selecione o arquivo do IGUATEMI", "Iguatemi Planilha 1T25.xlsx"),
-        ("Selecione o arquivo da MULTIPLAN", "Multiplan Planilha 1T25.xlsx"),
-    ]
+    file_mappings = [(f"Selecione o arquivo de {nome.upper()}", adaptador['arquivo'])
+                     for nome, adaptador in EMPRESAS.items()]
     
     for i, (title, reports_name) in enumerate(file_mappings, 1):
-        status_callback(f"Selecionando arquivo {i}/3: {title}")
+        status_callback(f"Selecionando arquivo {i}/{len(file_mappings)}: {title}")
         root.update_idletasks()
         
         file_path = filedialog.askopenfilename(
@@ -797,12 +1871,15 @@ def select_and_copy_files(root, status_callback):
 def main():
     """Função principal da interface gráfica"""
     try:
+        # tkinter só é importado pela interface; o modo linha de comando não depende dele
+        import tkinter as tk
+        from tkinter import messagebox, ttk
         debug_print("Iniciando aplicação...")
         
         # Configurar janela principal
         root = tk.Tk()
         root.title("Consolidador de Dados - Automatização de Reports")
-        root.geometry("540x420")
+        root.geometry("540x480")
         root.resizable(False, False)
         
         # Centralizar janela
@@ -812,8 +1889,8 @@ def main():
             # Fallback para centralizar manualmente
             root.update_idletasks()
             x = (root.winfo_screenwidth() // 2) - (540 // 2)
-            y = (root.winfo_screenheight() // 2) - (420 // 2)
-            root.geometry(f"540x420+{x}+{y}")
+            y = (root.winfo_screenheight() // 2) - (480 // 2)
+            root.geometry(f"540x480+{x}+{y}")
 
         # Frame principal
         main_frame = tk.Frame(root, bg="#f8f9fa", padx=30, pady=30)
@@ -824,7 +1901,7 @@ def main():
         title_label.pack(pady=(0, 8))
 
         # Subtítulo
-        subtitle_label = tk.Label(main_frame, text="Allos   •   Iguatemi   •   Multiplan", font=("Arial", 12, "italic"), fg="#2980b9", bg="#f8f9fa")
+        subtitle_label = tk.Label(main_frame, text="   •   ".join(EMPRESAS), font=("Arial", 12, "italic"), fg="#2980b9", bg="#f8f9fa")
         subtitle_label.pack(pady=(0, 18))
 
         # Instruções
@@ -840,6 +1917,34 @@ def main():
         progress.pack(pady=(0, 25))
         progress["value"] = 0
 
+        # Eventos publicados pela thread de processamento (ver run_processing)
+        eventos = queue.Queue()
+        estado = {'processor': None}
+
+        def drenar_eventos():
+            """Aplica na interface os eventos pendentes; reagenda-se até o fim do processamento"""
+            fim = None
+            try:
+                while True:
+                    evento, valor = eventos.get_nowait()
+                    if evento == 'progresso':
+                        progress["value"] = valor
+                    elif evento == 'status':
+                        status_label.config(text=valor)
+                    else:
+                        fim = (evento, valor)
+            except queue.Empty:
+                pass
+            if fim is None:
+                root.after(100, drenar_eventos)
+                return
+            estado['processor'] = None
+            cancel_btn.config(state="disabled")
+            start_btn.config(state="normal")
+            if fim[0] == 'cancelado':
+                status_label.config(text="Processamento cancelado")
+            show_result(*fim)
+
         def start_process():
             """Inicia o processo de seleção de arquivos e processamento"""
             debug_print("=== INICIANDO PROCESSO ===")
@@ -851,11 +1956,19 @@ def main():
                 status_label.config(text="Processo cancelado")
                 start_btn.config(state="normal")
                 return
-            progress["value"] = 5
             status_label.config(text="Arquivos selecionados. Iniciando processamento...")
-            root.update_idletasks()
-            thread = threading.Thread(target=run_processing, args=(progress, status_label, root), daemon=True)
+            estado['processor'] = ReportProcessor()
+            cancel_btn.config(state="normal")
+            thread = threading.Thread(target=run_processing, args=(estado['processor'], eventos), daemon=True)
             thread.start()
+            root.after(100, drenar_eventos)
+
+        def cancel_process():
+            """Pede o cancelamento; a thread para no próximo ponto de verificação"""
+            if estado['processor'] is not None:
+                estado['processor'].cancelar()
+                cancel_btn.config(state="disabled")
+                status_label.config(text="Cancelando...")
 
         # Botão principal (garantir que sempre aparece)
         start_btn = tk.Button(
@@ -872,7 +1985,24 @@ def main():
             activebackground="#219150",
             activeforeground="white"
         )
-        start_btn.pack(pady=(0, 30))
+        start_btn.pack(pady=(0, 10))
+
+        cancel_btn = tk.Button(
+            main_frame,
+            text="Cancelar",
+            command=cancel_process,
+            state="disabled",
+            font=("Arial", 10),
+            bg="#c0392b",
+            fg="white",
+            padx=20,
+            pady=4,
+            relief="flat",
+            cursor="hand2",
+            activebackground="#a93226",
+            activeforeground="white"
+        )
+        cancel_btn.pack(pady=(0, 20))
 
         # Rodapé
         footer = tk.Frame(main_frame, bg="#f8f9fa")
@@ -889,7 +2019,7 @@ def main():
     except Exception as e:
         debug_print(f"ERRO CRÍTICO na interface: {e}")
         debug_print(f"Traceback: {traceback.format_exc()}")
-        logging.error("Erro crítico na interface", exc_info=True)
+        logger.error("Erro crítico na interface", exc_info=True)
         
         # Tentar mostrar erro em uma janela simples
         try:
@@ -903,41 +2033,131 @@ def main():
             print("Verifique se o tkinter está instalado e funcionando.")
             input("Pressione Enter para sair...")
 
-def add_sss_allos_chart(input_excel, output_excel):
-    # Lê a primeira aba do consolidado
-    df = pd.read_excel(input_excel, sheet_name=0)
-    
-    # Filtra apenas a linha de SSS da Allos
-    sss_allos = df[(df['Empresa'] == 'Allos') & (df['Métrica'] == 'SSS')]
-    if sss_allos.empty:
-        print("Linha de SSS da Allos não encontrada.")
-        return
-    
-    # Cria um novo arquivo Excel com XlsxWriter
-    with pd.ExcelWriter(output_excel, engine='xlsxwriter') as writer:
-        df.to_excel(writer, sheet_name='Consolidado', index=False)
-        workbook  = writer.book
-        worksheet = writer.sheets['Consolidado']
-        
-        # Descobre o range dos dados
-        n_trimestres = len(df.columns) - 2
-        row = sss_allos.index[0]
-        
-        # Adiciona gráfico de linhas para SSS Allos
-        chart = workbook.add_chart({'type': 'line'})
-        chart.add_series({
-            'name':       ['Consolidado', row+1, 0],
-            'categories': ['Consolidado', 0, 2, 0, n_trimestres+1],
-            'values':     ['Consolidado', row+1, 2, row+1, n_trimestres+1],
-        })
-        chart.set_title({'name': 'SSS Allos'})
-        chart.set_x_axis({'name': 'Trimestre'})
-        chart.set_y_axis({'name': '%'})
-        worksheet.insert_chart('A2', chart)
-        
-    print(f"Arquivo com gráfico SSS Allos salvo em: {output_excel}")
+# Códigos de saída do modo linha de comando
+EXIT_OK = 0
+EXIT_FALHA = 1
+EXIT_ENTRADA = 2
+
+def build_arg_parser():
+    """Argumentos do modo linha de comando (sem interface gráfica)"""
+    parser = argparse.ArgumentParser(
+        prog='main_optimized',
+        description='Consolida os reports das empresas cadastradas (Allos, Iguatemi, Multiplan e as de '
+                    '--empresas) sem interface gráfica.')
+    parser.add_argument('--allos', help='Planilha da Allos (padrão: reports/Allos Planilha 1T25.xlsx)')
+    parser.add_argument('--iguatemi', help='Planilha do Iguatemi (padrão: reports/Iguatemi Planilha 1T25.xlsx)')
+    parser.add_argument('--multiplan', help='Planilha da Multiplan (padrão: reports/Multiplan Planilha 1T25.xlsx)')
+    parser.add_argument('--report', action='append', default=[], metavar='EMPRESA=CAMINHO',
+                        help='Planilha de qualquer empresa cadastrada (pode repetir)')
+    parser.add_argument('--empresas', metavar='JSON',
+                        help='Adaptadores de outras empresas: {nome: {aba, celulas, normalizar, rotulos, arquivo}}')
+    parser.add_argument('--backfill', metavar='PASTA',
+                        help='Pasta com os reports de vários trimestres (ex.: Allos Planilha 4T24.xlsx); '
+                             'gera um único histórico, valendo a divulgação mais recente')
+    parser.add_argument('-o', '--output-dir', required=True,
+                        help='Pasta de saída do Consolidado.xlsx e da imagem dos gráficos')
+    parser.add_argument('--sem-inflacao', action='store_true',
+                        help='Não consulta o BCB nem gera as abas/linhas de inflação')
+    parser.add_argument('--sem-png', action='store_true', help='Não gera a imagem dos gráficos (matplotlib)')
+    parser.add_argument('--sem-graficos-excel', action='store_true',
+                        help='Não gera os gráficos nativos na aba Graficos')
+    parser.add_argument('--dpi', type=int, default=300, help='Resolução da imagem dos gráficos')
+    parser.add_argument('--save-treated', action='store_true',
+                        help='Gera os arquivos intermediários em data_treated (debug)')
+    parser.add_argument('--parallel', action='store_true', help='Lê cada empresa num processo separado')
+    parser.add_argument('--sem-cache', action='store_true',
+                        help='Ignora o cache de extração e relê todos os reports')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Mostra e registra as mensagens de debug (uma por linha extraída)')
+    parser.add_argument('--relatorio', metavar='JSON', help='Grava o relatório da execução (medições por etapa)')
+    parser.add_argument('--memoria', action='store_true',
+                        help='Mede o pico de memória de cada etapa (tracemalloc; deixa a execução mais lenta)')
+    parser.add_argument('--perfil', metavar='PASTA', help='Grava o cProfile de cada etapa (.prof e .txt) na pasta')
+    return parser
+
+def run_cli(argv=None):
+    """Executa a consolidação sem interface gráfica; retorna o código de saída"""
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    configurar_logging(verbose=args.verbose)
+    if args.empresas:
+        try:
+            carregar_empresas(args.empresas)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Erro ao carregar {args.empresas}: {e}", file=sys.stderr)
+            return EXIT_ENTRADA
+    outros = []
+    for item in args.report:
+        nome, sep, caminho = item.partition('=')
+        if not sep or nome not in EMPRESAS:
+            parser.error(f"--report {item}: use EMPRESA=CAMINHO com uma empresa cadastrada ({', '.join(EMPRESAS)})")
+        outros.append((nome, caminho))
+    # Caminhos relativos ao diretório atual: ReportProcessor muda o cwd para a pasta do script
+    reports = {nome: os.path.abspath(caminho)
+               for nome, caminho in [('Allos', args.allos), ('Iguatemi', args.iguatemi), ('Multiplan', args.multiplan)]
+               + outros
+               if caminho}
+    output_dir = Path(args.output_dir).resolve()
+
+    backfill = os.path.abspath(args.backfill) if args.backfill else None
+    perfil = os.path.abspath(args.perfil) if args.perfil else None
+    relatorio = os.path.abspath(args.relatorio) if args.relatorio else None
+
+    processor = ReportProcessor()
+    processor.reports.update(reports)
+    if backfill:
+        if not os.path.isdir(backfill):
+            print(f"Pasta não encontrada: {backfill}", file=sys.stderr)
+            return EXIT_ENTRADA
+    else:
+        faltando = [caminho for caminho in processor.reports.values() if not os.path.exists(caminho)]
+        if faltando:
+            print(f"Arquivos não encontrados: {', '.join(faltando)}", file=sys.stderr)
+            return EXIT_ENTRADA
+
+    processor.destino = output_dir
+    # Jobs simultâneos gravam só na própria pasta de saída
+    processor.copia_data_treated = False
+    if args.sem_cache:
+        processor.cache_extracao = None
+    processor.opcoes_medicao.update(memoria=args.memoria, perfil=perfil, relatorio=relatorio)
+    processor.pasta_graficos = output_dir
+    processor.opcoes_grafico.update(abrir=False, dpi=args.dpi, png=not args.sem_png,
+                                    excel=not args.sem_graficos_excel)
+
+    status = lambda msg: print(msg, flush=True)
+    inicio = time.perf_counter()
+    if backfill:
+        try:
+            processor.backfill(backfill, status_callback=status, inflacao=not args.sem_inflacao)
+            sucesso = True
+        except Exception as e:
+            debug_print(f"ERRO durante o backfill: {e}")
+            logger.error("Erro no backfill", exc_info=True)
+            sucesso = False
+    else:
+        sucesso = processor.process_files(status_callback=status, save_treated=args.save_treated,
+                                          parallel=args.parallel, inflacao=not args.sem_inflacao)
+    total = time.perf_counter() - inicio
+
+    print(f"\n  {'etapa':<15} {'relógio':>9} {'CPU':>9} {'CPU filhos':>11}" + (f" {'pico mem.':>10}" if args.memoria else ''))
+    for etapa, medicao in processor.medicoes.items():
+        linha = f"  {etapa:<15} {medicao['wall_s']:8.3f}s {medicao['cpu_s']:8.3f}s {medicao['cpu_filhos_s']:10.3f}s"
+        if 'pico_memoria_mb' in medicao:
+            linha += f" {medicao['pico_memoria_mb']:7.1f} MB"
+        print(linha)
+    print(f"  {'total':<15} {total:8.3f}s")
+    if not sucesso:
+        print("Falha no processamento. Verifique erro_consolidador.log.", file=sys.stderr)
+        return EXIT_FALHA
+    print(f"Consolidado salvo em: {output_dir / 'Consolidado.xlsx'}")
+    return EXIT_OK
 
-# Teste simples
+# Sem argumentos abre a interface gráfica; com argumentos roda em linha de comando
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Necessário para o pool de processos no executável
+    if len(sys.argv) > 1:
+        sys.exit(run_cli())
+    configurar_logging()
     main() 
     
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""Localização das linhas por rótulo (ReportProcessor.get_rows_values_by_label)
+
+Abas com blocos repetidos, em que rótulos genéricos como "SSS" ou "Trimestre"
+aparecem mais de uma vez:
+
+    python -m unittest test_rotulos
+"""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import openpyxl
+
+from main_optimized import ROTULOS_PADRAO, Quarter, ReportProcessor
+
+# Linhas da aba {linha: [rótulo, valores...]} a partir da coluna B, células do adaptador e SSS esperado
+_BLOCO_2020 = ['Trimestre', '1T20', '2T20', '3T20']
+_BLOCO_2025 = ['Trimestre', '1T25', '2T25', '3T25']
+_SSS_2025 = {'1T25': 0.5, '2T25': 1.5, '3T25': 2.5}
+CASOS_ROTULOS = {
+    'rótulo na célula fixa vale sobre ocorrência anterior': (
+        {10: _BLOCO_2020, 12: ['SSS', 9, 9, 9], 48: _BLOCO_2025, 50: ['SSS', 0.5, 1.5, 2.5]},
+        {'Trimestres': 'B48', 'SSS': 'B50'}, _SSS_2025),
+    'linha deslocada usa a ocorrência mais próxima': (
+        {10: _BLOCO_2020, 12: ['SSS', 9, 9, 9], 48: _BLOCO_2025, 52: ['SSS', 0.5, 1.5, 2.5]},
+        {'Trimestres': 'B48', 'SSS': 'B50'}, _SSS_2025),
+    'métrica usa o cabeçalho do próprio bloco': (
+        {10: _BLOCO_2020, 12: ['SSR', 9, 9, 9], 48: _BLOCO_2025, 50: ['SSS', 0.5, 1.5, 2.5]},
+        {'Trimestres': 'B10', 'SSS': 'B50'}, _SSS_2025),
+    'alias genérico em bloco anterior': (
+        {5: ['Quarter', '1T19', '2T19', '3T19'], 20: ['Same Store Sales', 9, 9, 9],
+         48: _BLOCO_2025, 50: ['Vendas Mesmas Lojas', 0.5, 1.5, 2.5]},
+        {'Trimestres': 'B47', 'SSS': 'B49'}, _SSS_2025),
+}
+
+
+class LocalizacaoPorRotuloTest(unittest.TestCase):
+    def setUp(self):
+        # ReportProcessor muda o diretório de trabalho para a pasta do script
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        pasta = tempfile.TemporaryDirectory(prefix='teste_rotulos_')
+        self.addCleanup(pasta.cleanup)
+        self.pasta = Path(pasta.name)
+        self.processor = ReportProcessor()
+        self.processor.cache_extracao = None
+
+    def extrair_sss(self, linhas, celulas):
+        caminho = self.pasta / 'rotulos.xlsx'
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = 'Indicadores'
+        for row, valores in linhas.items():
+            for col, valor in enumerate(valores, 2):
+                ws.cell(row=row, column=col, value=valor)
+        wb.save(caminho)
+        self.processor.empresas = {'Teste': {'arquivo': caminho.name, 'tratado': 'teste.xlsx', 'aba': 'Indicadores',
+                                             'normalizar': False, 'celulas': celulas, 'rotulos': {}}}
+        self.processor.rotulos = {'Teste': dict(ROTULOS_PADRAO)}
+        self.processor.reports = {'Teste': str(caminho)}
+        fonte = self.processor.get_files_to_process()[0]
+        return self.processor.extract_report_series(fonte).get(('Teste', 'SSS'), {})
+
+    def test_casos(self):
+        for caso, (linhas, celulas, esperado) in CASOS_ROTULOS.items():
+            with self.subTest(caso):
+                self.assertEqual(self.extrair_sss(linhas, celulas),
+                                 {Quarter.parse(t): v for t, v in esperado.items()})
+
+
+if __name__ == '__main__':
+    unittest.main()